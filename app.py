@@ -2,7 +2,7 @@
 # app.py — Proyecto Analítica de Denuncias + Chat IA + Auditoría
 # ============================================================
 import os
-import re
+import threading
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
@@ -14,15 +14,28 @@ from flask import (
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user, UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from cachetools import TTLCache
 from sklearn.cluster import KMeans
 
 # ---- Módulos del Proyecto ----
 from ml_utils import (
-    db, predecir_total_2026, obtener_contexto_ia, 
-    entrenar_modelo_riesgo, predecir_valor_especifico
+    db, predecir_valor_especifico, predecir_lote
 )
-from mongo_queries import ranking_departamentos
+from ml_registro import obtener_modelo_riesgo, precargar_modelos
+from presencia import registrar_actividad, volcar_actividad, iniciar_volcado_periodico
+from pronostico_2026 import obtener_pronostico, calcular_pronostico, iniciar_job_pronostico, version_pronostico
+from mongo_queries import snapshot_dashboard, vistas_departamentos
+from departamentos_dim import GRUPOS
+from rollup_denuncias import coleccion_rollup, leer_totales
+from mongo_cache import agregar, estadisticas_cache, pipelines_registrados
+from indices_mongo import aplicar_indices, reporte_explain
+from reportes import ejecutar_reporte
+from snapshot_parquet import cargar_snapshot
+from cache_http import cache_por_version
+from mongo_async import en_hilo, agregar_async, reunir, reunir_lote
+from mongo_cliente import obtener_db, obtener_db_analitica, metricas_pool
 from ml_cluster import clusterizar_departamentos
 from ml_llm import (
     consultar_estratega_ia, analizar_riesgo_ia, consultar_chat_general
@@ -48,12 +61,29 @@ class User(UserMixin):
         self.username = user_data['username']
         self.rol = user_data.get('rol', 'invitado')
 
+# Caché de usuarios para Flask-Login: evita un find_one en cada petición.
+# Se invalida cuando se crea o modifica un usuario.
+_usuarios_cache = TTLCache(maxsize=512, ttl=int(os.getenv("USUARIOS_CACHE_TTL_SEGUNDOS", 120)))
+_usuarios_lock = threading.Lock()
+
+def invalidar_usuario(username):
+    with _usuarios_lock:
+        _usuarios_cache.pop(username, None)
+
 @login_manager.user_loader
 def load_user(user_id):
+    with _usuarios_lock:
+        user = _usuarios_cache.get(user_id)
+    if user is not None:
+        return user
+
     users_col = db['usuarios']
-    user_data = users_col.find_one({"username": user_id})
+    user_data = users_col.find_one({"username": user_id}, {"username": 1, "rol": 1})
     if user_data:
-        return User(user_data)
+        user = User(user_data)
+        with _usuarios_lock:
+            _usuarios_cache[user_id] = user
+        return user
     return None
 
 # ================================
@@ -61,11 +91,30 @@ def load_user(user_id):
 # ================================
 if db is None:
     print("⚠️ Advertencia: db no importada de ml_utils, intentando conexión local...")
-    mongo_uri = os.environ.get('MONGO_URI', "mongodb://localhost:27017/")
-    client = MongoClient(mongo_uri)
-    db = client['denuncias_db']
+    db = obtener_db()
 
 col = db['denuncias']
+# Cubo pre-agregado (ANIO × MES × DPTO × MODALIDAD) que construye el ETL.
+# Las rutas de reportes leen de aquí en lugar de escanear 'denuncias',
+# desde un secundario si el cluster lo tiene (mismo cliente y pool).
+# Se resuelve en cada uso (ver coleccion_rollup): si la app arrancó antes
+# del primer ETL, pasa al rollup en cuanto cambia la versión de datos.
+db_analitica = obtener_db_analitica(db)
+
+def rollup():
+    return coleccion_rollup(db_analitica)
+
+cargar_snapshot()  # Foto Parquet del rollup, si el ETL la dejó
+
+# Modelo de riesgo del simulador: se carga/entrena en segundo plano
+precargar_modelos(rollup(), ["Extorsión"])
+# Proyección 2026: se recalcula en segundo plano cuando cambian los datos
+iniciar_job_pronostico(rollup)
+# Índices declarados en indices_mongo.py (idempotente; en segundo plano para no demorar el arranque)
+threading.Thread(target=aplicar_indices, args=(db,), name="indices", daemon=True).start()
+
+# Presencia de usuarios: los latidos se vuelcan en bloque cada 30 s
+iniciar_volcado_periodico(db)
 
 # ============================================================
 #  DECORADORES PERSONALIZADOS
@@ -91,14 +140,8 @@ def admin_required(f):
 @app.before_request
 def update_last_seen():
     if current_user.is_authenticated:
-        try:
-            # Actualizamos 'last_seen' cada vez que el usuario hace algo
-            db['usuarios'].update_one(
-                {"username": current_user.username},
-                {"$set": {"last_seen": datetime.now()}}
-            )
-        except Exception as e:
-            print(f"Error actualizando last_seen: {e}")
+        # Solo se anota en memoria; presencia.py lo vuelca a Mongo en bloque
+        registrar_actividad(current_user.username)
 
 # ============================================================
 #  LOGIN / LOGOUT
@@ -158,25 +201,30 @@ def logout():
 def index():
     visitas = 0
     try:
-        stats_col = db['estadisticas']
-        stats_col.update_one(
+        # Un solo viaje: incrementa y devuelve el documento actualizado
+        dato_visitas = db['estadisticas'].find_one_and_update(
             {'_id': 'contador_home'},
             {'$inc': {'cantidad': 1}},
-            upsert=True
+            upsert=True,
+            return_document=ReturnDocument.AFTER
         )
-        dato_visitas = stats_col.find_one({'_id': 'contador_home'})
         if dato_visitas:
             visitas = dato_visitas.get('cantidad', 0)
     except Exception as e:
         print(f"⚠️ Error en contador de visitas: {e}")
 
-    total_registros = col.count_documents({})
-    
-    pipeline = [{"$group": {"_id": None, "total": {"$sum": "$cantidad"}}}]
-    res = list(col.aggregate(pipeline))
-    total_denuncias = res[0]["total"] if res else 0
-
-    anios = sorted(col.distinct("ANIO"))
+    # Totales guardados por el ETL (cacheados por versión de datos)
+    totales = leer_totales(db)
+    if totales:
+        total_registros = totales["total_registros"]
+        total_denuncias = totales["total_denuncias"]
+        anios = totales["anios"]
+    else:
+        # Sin totales guardados: estimación por metadatos + rollup cacheado
+        total_registros = col.estimated_document_count()
+        res = agregar(rollup(), [{"$group": {"_id": None, "total": {"$sum": "$cantidad"}}}])
+        total_denuncias = res[0]["total"] if res else 0
+        anios = sorted(d["_id"] for d in agregar(rollup(), [{"$group": {"_id": "$ANIO"}}]) if d["_id"] is not None)
 
     return render_template(
         "index.html",
@@ -194,6 +242,7 @@ def index():
 def usuarios_activos():
     try:
         # 1. Usuarios Online (Activos en los últimos 5 min)
+        volcar_actividad(db)  # Aseguramos que los latidos en memoria estén en la BD
         limite_tiempo = datetime.now() - timedelta(minutes=5)
         users_col = db['usuarios']
         usuarios_online = list(users_col.find({"last_seen": {"$gt": limite_tiempo}}))
@@ -211,96 +260,40 @@ def usuarios_activos():
 # ============================================================
 #  RUTAS DE REPORTES BÁSICOS
 # ============================================================
+# Cada ruta de gráfico tiene su función de datos (devuelve las variables
+# del template); la misma función alimenta la versión JSON en /api/graficos.
+def datos_resumen_anual():
+    datos = snapshot_dashboard(rollup())["por_anio"]
+    labels = [doc["_id"] for doc in datos]
+    valores = [doc["total"] for doc in datos]
+    return {"labels": labels, "valores": valores, "tabla": datos}
+
 @app.route("/resumen-anual")
 @login_required
 def resumen_anual():
-    pipeline = [
-        {"$group": {"_id": "$ANIO", "total": {"$sum": "$cantidad"}}},
-        {"$sort": {"_id": 1}}
-    ]
-    datos = list(col.aggregate(pipeline))
-    labels = [doc["_id"] for doc in datos]
-    valores = [doc["total"] for doc in datos]
-    return render_template("resumen_anual.html", labels=labels, valores=valores, tabla=datos)
+    return render_template("resumen_anual.html", **datos_resumen_anual())
+
+def datos_departamentos():
+    # Mapa (Highcharts codes) y top 5 salen de la dimensión de departamentos
+    vistas = vistas_departamentos(rollup())
+    return {"data_mapa": vistas["mapa"], "top_5": vistas["ranking"][:5]}
 
 @app.route('/departamentos')
 @login_required
 def departamentos():
-    # Traemos 50 para asegurar que vengan todos, incluso los pequeños
-    data_raw = ranking_departamentos(col, n=50) 
-    
-    # DICCIONARIO MAESTRO MAPA (Highcharts codes)
-    map_mapping = {
-        # --- LAS LIMAS (SOLUCIÓN DEL PROBLEMA) ---
-        "LIMA METROPOLITANA": "pe-li",       # Código 'pe-li': Lima Ciudad (Azul Oscuro)
-        "REGION LIMA": "pe-lr",              # Código 'pe-lr': Lima Provincias (Donut alrededor)
-        "LIMA": "pe-li",                     # Respaldo por si aparece solo "LIMA"
-        
-        # --- EL CALLAO ---
-        "PROV. CONST. DEL CALLAO": "pe-cl",  # Callao tiene su propio código
-        "CALLAO": "pe-cl",
-
-        # --- EL RESTO DEL PERÚ ---
-        "AMAZONAS": "pe-am",
-        "ANCASH": "pe-an",
-        "APURIMAC": "pe-ap",
-        "AREQUIPA": "pe-ar",
-        "AYACUCHO": "pe-ay",
-        "CAJAMARCA": "pe-cj",
-        "CUSCO": "pe-cs",
-        "HUANCAVELICA": "pe-hv",
-        "HUANUCO": "pe-hc",
-        "ICA": "pe-ic",
-        "JUNIN": "pe-ju",
-        "LA LIBERTAD": "pe-ll",
-        "LAMBAYEQUE": "pe-lb",
-        "LORETO": "pe-lo",
-        "MADRE DE DIOS": "pe-md",
-        "MOQUEGUA": "pe-mq",
-        "PASCO": "pe-pa",
-        "PIURA": "pe-pi",
-        "PUNO": "pe-pu",
-        "SAN MARTIN": "pe-sm",
-        "TACNA": "pe-ta",
-        "TUMBES": "pe-tu",
-        "UCAYALI": "pe-uc"
-    }
-
-    data_mapa = []
-    top_5 = data_raw[:5]
-
-    for d in data_raw:
-        # Limpieza: Mayúsculas y sin espacios a los lados
-        nombre_bd = str(d["_id"]).strip().upper()
-        
-        # Mapeo exacto
-        code = map_mapping.get(nombre_bd)
-        
-        if code:
-            data_mapa.append([code, d["total"]])
-        else:
-            # Esto nos ayudará a ver en los logs de Render si algún nombre sigue fallando
-            print(f"⚠️ NO MAPEADO EN MAPA: {nombre_bd}")
-
-    return render_template('departamentos.html', data_mapa=data_mapa, top_5=top_5)
+    return render_template('departamentos.html', **datos_departamentos())
 
 # ============================================================
 # CLUSTERING (K-MEANS) - LA FUNCIÓN QUE FALTABA
 # ============================================================
-@app.route('/cluster-departamentos')
-@login_required
-def cluster_departamentos():
-    # Agrupamos datos por departamento
-    pipeline = [
-        {"$group": {"_id": "$DPTO_HECHO_NEW", "total": {"$sum": "$cantidad"}}},
-        {"$sort": {"total": 1}}
-    ]
-    data_bd = list(col.aggregate(pipeline))
+def datos_cluster_departamentos():
+    # Totales por departamento (ordenados de menor a mayor) del snapshot del dashboard
+    data_bd = snapshot_dashboard(rollup())["por_departamento"]
     
     # Limpieza de nulos
     data_clean = [d for d in data_bd if d["_id"]]
     
-    if len(data_clean) < 3: return "Datos insuficientes para clusters."
+    if len(data_clean) < 3: return None
 
     # Preparamos datos para Machine Learning
     nombres = [d["_id"] for d in data_clean]
@@ -334,212 +327,186 @@ def cluster_departamentos():
         "alto": sum(1 for r in resultados if r['cluster'] == 2)
     }
     
-    return render_template('cluster_departamentos.html', data=resultados, stats=stats)
+    return {"data": resultados, "stats": stats}
 
-@app.route("/departamentos-percapita")
+@app.route('/cluster-departamentos')
 @login_required
-def departamentos_percapita():
-    pipeline = [
-        {"$group": {"_id": "$DPTO_HECHO_NEW", "total": {"$sum": "$cantidad"}}},
-        {"$sort": {"_id": 1}}
-    ]
-    datos = list(col.aggregate(pipeline))
-    
-    # Poblaciones aproximadas (INEI)
-    poblaciones = {
-        "MADRE DE DIOS": 184083,
-        "AREQUIPA": 1523839,
-        "LAMBAYEQUE": 1367029,
-        "MOQUEGUA": 200973,
-        "ICA": 1004829,
-        "TUMBES": 280723,
-        "TACNA": 397737,
-        "APURIMAC": 436820,
-        "JUNIN": 1418738,
-        "CUSCO": 1428028,
-        "ANCASH": 1202828,
-        "HUANUCO": 782039,
-        "AMAZONAS": 458022,
-        "LA LIBERTAD": 2078028,
-        "PIURA": 2138730,
-        "AYACUCHO": 671182,
-        "UCAYALI": 568028,
-        "SAN MARTIN": 924292,
-        "PASCO": 278028,
-        "CAJAMARCA": 1503836,
-        "PUNO": 1268093,
-        "LORETO": 1138637,
-        "HUANCAVELICA": 371038,
-        "LIMA METROPOLITANA": 11810722,
-        "REGION LIMA": 1092827,
-        "PROV. CONST. DEL CALLAO": 1147628,
-        # ... completa las demás
-    }
-
-    tabla = []
-    for d in datos:
-        depto = d["_id"]
-        total = d["total"]
-        pob = poblaciones.get(depto, 1000000) # Default para evitar error div/0
-        tasa = (total / pob) * 100000
-        tabla.append({"departamento": depto, "total": total, "poblacion": pob, "tasa": tasa})
+def cluster_departamentos():
+    datos = datos_cluster_departamentos()
+    if datos is None: return "Datos insuficientes para clusters."
+    return render_template('cluster_departamentos.html', **datos)
 
-    tabla = sorted(tabla, key=lambda x: x["tasa"], reverse=True)
+def datos_departamentos_percapita():
+    # Poblaciones aproximadas (INEI) en departamentos_dim.py
+    tabla = vistas_departamentos(rollup())["percapita"]
     labels = [r["departamento"] for r in tabla]
     valores = [r["tasa"] for r in tabla]
+    return {"labels": labels, "valores": valores, "tabla": tabla}
 
-    return render_template("departamentos_percapita.html", labels=labels, valores=valores, tabla=tabla)
+@app.route("/departamentos-percapita")
+@login_required
+def departamentos_percapita():
+    return render_template("departamentos_percapita.html", **datos_departamentos_percapita())
+
+def datos_regiones():
+    # Clasificación Costa/Sierra/Selva según departamentos_dim.py
+    tabla = vistas_departamentos(rollup())["regiones"]
+    return {"labels": [x["_id"] for x in tabla], "valores": [x["total"] for x in tabla], "tabla": tabla}
 
 @app.route("/regiones")
 @login_required
 def regiones():
-    pipeline = [{"$group": {"_id": "$DPTO_HECHO_NEW", "total": {"$sum": "$cantidad"}}}]
-    datos = list(col.aggregate(pipeline))
-    
-    # DICCIONARIO EXACTO (Copiado de tus datos reales)
-    mapa_regiones = {
-        # COSTA
-        "TUMBES": "Costa", 
-        "PIURA": "Costa", 
-        "LAMBAYEQUE": "Costa", 
-        "LA LIBERTAD": "Costa", 
-        "ANCASH": "Costa", 
-        "LIMA METROPOLITANA": "Costa",      # <--- ¡AQUÍ ESTABA EL FANTASMA!
-        "REGION LIMA": "Costa",             # <--- Y AQUÍ
-        "PROV. CONST. DEL CALLAO": "Costa", 
-        "CALLAO": "Costa",
-        "ICA": "Costa", 
-        "AREQUIPA": "Costa", 
-        "MOQUEGUA": "Costa", 
-        "TACNA": "Costa",
-
-        # SIERRA
-        "CAJAMARCA": "Sierra", 
-        "HUANUCO": "Sierra", 
-        "PASCO": "Sierra", 
-        "JUNIN": "Sierra", 
-        "HUANCAVELICA": "Sierra", 
-        "AYACUCHO": "Sierra", 
-        "APURIMAC": "Sierra", 
-        "CUSCO": "Sierra", 
-        "PUNO": "Sierra",
-
-        # SELVA
-        "AMAZONAS": "Selva", 
-        "LORETO": "Selva", 
-        "SAN MARTIN": "Selva", 
-        "UCAYALI": "Selva", 
-        "MADRE DE DIOS": "Selva"
-    }
-    
-    acumulado = {"Costa": 0, "Sierra": 0, "Selva": 0}
-    
-    for d in datos:
-        nombre_bd = str(d["_id"]).strip().upper()
-        
-        # Clasificación directa
-        region = mapa_regiones.get(nombre_bd)
-        
-        if region:
-            acumulado[region] += d["total"]
-        else:
-            # Si falla, miramos en los logs (Render) qué nombre raro apareció
-            print(f"⚠️ DATO SIN REGIÓN: '{nombre_bd}'") 
-            
-            # Fallback de seguridad para no perder datos (Asumimos Costa para Lima/Callao raros)
-            if "LIMA" in nombre_bd or "CALLAO" in nombre_bd:
-                acumulado["Costa"] += d["total"]
-
-    tabla = [
-        {"_id": "Costa", "total": acumulado["Costa"]},
-        {"_id": "Sierra", "total": acumulado["Sierra"]},
-        {"_id": "Selva", "total": acumulado["Selva"]}
-    ]
-    
-    tabla = sorted(tabla, key=lambda x: x["total"], reverse=True)
-    
-    return render_template("regiones.html", 
-                           labels=[x["_id"] for x in tabla], 
-                           valores=[x["total"] for x in tabla], 
-                           tabla=tabla)
+    return render_template("regiones.html", **datos_regiones())
 
 # ============================================================
 #  RUTAS DE ANÁLISIS TÉCNICO
 # ============================================================
+def datos_modalidades():
+    datos = snapshot_dashboard(rollup())["por_modalidad"]
+    return {"labels": [d["_id"] for d in datos], "valores": [d["total"] for d in datos], "tabla": datos}
+
 @app.route("/modalidades")
 @login_required
 def modalidades():
-    pipeline = [
-        {"$group": {"_id": "$P_MODALIDADES", "total": {"$sum": "$cantidad"}}},
-        {"$sort": {"total": -1}}
-    ]
-    datos = list(col.aggregate(pipeline))
-    return render_template("modalidades.html", labels=[d["_id"] for d in datos], valores=[d["total"] for d in datos], tabla=datos)
+    return render_template("modalidades.html", **datos_modalidades())
+
+def datos_trimestres():
+    datos = snapshot_dashboard(rollup())["por_trimestre"]
+    return {"labels": [d["_id"] for d in datos], "valores": [d["total"] for d in datos], "tabla": datos}
 
 @app.route("/trimestres")
 @login_required
 def trimestres():
-    pipeline = [
-        {"$group": {"_id": "$anio_trimestre", "total": {"$sum": "$cantidad"}}},
-        {"$sort": {"_id": 1}}
-    ]
-    datos = list(col.aggregate(pipeline))
-    return render_template("trimestres.html", labels=[d["_id"] for d in datos], valores=[d["total"] for d in datos], tabla=datos)
+    return render_template("trimestres.html", **datos_trimestres())
 
 
+@app.route('/reporte')
+@login_required
+@cache_por_version(db)
+def reporte():
+    """
+    Reporte parametrizado sobre el rollup (JSON). Parámetros (todos opcionales):
+      departamentos, modalidades (repetibles), desde, hasta,
+      granularidad = anio | trimestre | mes, serie = modalidad | departamento | total,
+      nivel_departamento = departamento | codigo | grupo | region,
+      nivel_modalidad = modalidad | familia
+    """
+    args = request.args
+    try:
+        resultado = ejecutar_reporte(
+            rollup(),
+            departamentos=args.getlist('departamentos'),
+            modalidades=args.getlist('modalidades'),
+            anio_desde=args.get('desde', type=int),
+            anio_hasta=args.get('hasta', type=int),
+            granularidad=args.get('granularidad', 'anio'),
+            serie=args.get('serie', 'modalidad'),
+            nivel_departamento=args.get('nivel_departamento', 'departamento'),
+            nivel_modalidad=args.get('nivel_modalidad', 'modalidad'),
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(resultado)
+
+def datos_comparativa_foco():
+    rep = ejecutar_reporte(rollup(), modalidades=["Extorsión", "Homicidio"], granularidad="trimestre")
+
+    # Totales por trimestre sumando todos los años
+    chart_data = {"Extorsión": {}, "Homicidio": {}}
+    for f in rep["filas"]:
+        tri = f["trimestre"]
+        chart_data[f["serie"]][tri] = chart_data[f["serie"]].get(tri, 0) + f["total"]
+
+    return {"datos": chart_data}
+
 @app.route('/comparativa-foco')
 @login_required
 def comparativa_foco():
-    pipeline = [
-        {"$match": {"P_MODALIDADES": {"$in": ["Extorsión", "Homicidio"]}}},
-        {"$group": {"_id": {"trimestre": "$trimestre", "mod": "$P_MODALIDADES"}, "total": {"$sum": "$cantidad"}}}
-    ]
-    res = list(col.aggregate(pipeline))
-    
-    chart_data = {"Extorsión": {}, "Homicidio": {}}
-    for r in res:
-        mod = r["_id"].get("mod")
-        tri = r["_id"].get("trimestre")
-        if mod in chart_data and tri:
-            chart_data[mod][tri] = r["total"]
-            
-    return render_template('comparativa_foco.html', datos=chart_data)
+    return render_template('comparativa_foco.html', **datos_comparativa_foco())
+
+def datos_reporte_lima():
+    # Igualdad sobre campos normalizados por el ETL (indexados), sin $regex
+    rep = ejecutar_reporte(
+        rollup(),
+        departamentos=["LIMA"], nivel_departamento="grupo",
+        modalidades=["EXTORSION", "HOMICIDIO"], nivel_modalidad="familia",
+        granularidad="trimestre"
+    )
+    return {"labels": rep["periodos"], "extorsion": rep["series"]["EXTORSION"], "homicidio": rep["series"]["HOMICIDIO"]}
 
 @app.route('/reporte-lima')
 @login_required
 def reporte_lima():
-    pipeline = [
-        {
-            "$match": {
-                "DPTO_HECHO_NEW": {"$regex": "LIMA", "$options": "i"},
-                "P_MODALIDADES": {"$in": [re.compile("EXTORSI", re.I), re.compile("HOMICIDI", re.I)]}
-            }
-        },
-        {
-            "$project": {
-                "anio": "$ANIO", "trimestre": {"$ifNull": ["$trimestre", "T1"]}, "cantidad": "$cantidad",
-                "modalidad": {"$cond": [{"$regexMatch": {"input": "$P_MODALIDADES", "regex": "EXTORSI", "options": "i"}}, "Extorsión", "Homicidio"]}
-            }
-        },
-        {"$group": {"_id": {"anio": "$anio", "trim": "$trimestre", "mod": "$modalidad"}, "total": {"$sum": "$cantidad"}}},
-        {"$sort": {"_id.anio": 1, "_id.trim": 1}}
-    ]
-    datos = list(col.aggregate(pipeline))
-    
-    labels = sorted(list(set(f"{d['_id']['anio']}-{d['_id']['trim']}" for d in datos)))
-    data_ext = []
-    data_hom = []
-    
-    temp = {l: {"Extorsión": 0, "Homicidio": 0} for l in labels}
-    for d in datos:
-        key = f"{d['_id']['anio']}-{d['_id']['trim']}"
-        temp[key][d['_id']['mod']] = d['total']
-        
-    for l in labels:
-        data_ext.append(temp[l]["Extorsión"])
-        data_hom.append(temp[l]["Homicidio"])
-        
-    return render_template('reporte_lima.html', labels=labels, extorsion=data_ext, homicidio=data_hom)
+    return render_template('reporte_lima.html', **datos_reporte_lima())
+
+# ============================================================
+#  API JSON DE GRÁFICOS (CON CACHÉ HTTP)
+# ============================================================
+# /api/graficos/<nombre> devuelve las mismas variables que recibe el template
+# de la ruta, con ETag/Last-Modified según la versión de datos.
+def datos_prediccion_2026():
+    pron = obtener_pronostico(rollup())
+    return {"total": pron["total"], "etiquetas": pron["etiquetas"], "valores": pron["valores"]}
+
+GRAFICOS = {
+    "resumen-anual": datos_resumen_anual,
+    "departamentos": datos_departamentos,
+    "cluster-departamentos": datos_cluster_departamentos,
+    "departamentos-percapita": datos_departamentos_percapita,
+    "regiones": datos_regiones,
+    "modalidades": datos_modalidades,
+    "trimestres": datos_trimestres,
+    "comparativa-foco": datos_comparativa_foco,
+    "reporte-lima": datos_reporte_lima,
+    "prediccion-2026": datos_prediccion_2026,
+    "riesgo-modalidad": datos_riesgo_modalidad,
+}
+
+def _version_pronostico_pedido(nombres):
+    # El pronóstico se recalcula en segundo plano tras el ETL: mientras tanto
+    # se sirve el anterior, así que su versión también va en el ETag
+    if "prediccion-2026" in nombres:
+        return f"pronostico-{version_pronostico()}"
+    return None
+
+@app.route('/api/graficos/<nombre>')
+@login_required
+@cache_por_version(db, extra=lambda nombre: _version_pronostico_pedido([nombre]))
+def api_graficos(nombre):
+    funcion = GRAFICOS.get(nombre)
+    if funcion is None:
+        return jsonify({'error': f"Gráfico desconocido: {nombre}"}), 404
+    datos = funcion()
+    if datos is None:
+        return jsonify({'error': "Datos insuficientes."}), 404
+    return jsonify(datos)
+
+@app.route('/api/graficos')
+@login_required
+@cache_por_version(db, extra=lambda: _version_pronostico_pedido(request.args.getlist('nombres') or GRAFICOS))
+async def api_graficos_lote():
+    """
+    Varios gráficos en una sola petición (?nombres=resumen-anual&nombres=regiones...),
+    calculados en paralelo. Sin 'nombres' devuelve todos. Mismos errores que
+    /api/graficos/<nombre>: 404 si alguno no existe o no tiene datos; si el
+    lote se pasa del tiempo, 503 con los que sí terminaron.
+    """
+    nombres = list(dict.fromkeys(request.args.getlist('nombres'))) or list(GRAFICOS)
+    desconocidos = [n for n in nombres if n not in GRAFICOS]
+    if desconocidos:
+        return jsonify({'error': f"Gráficos desconocidos: {', '.join(desconocidos)}"}), 404
+
+    resultados, pendientes = await reunir_lote({n: GRAFICOS[n] for n in nombres})
+    if pendientes:
+        return jsonify({
+            'error': f"Tiempo de espera agotado: {', '.join(pendientes)}",
+            'graficos': {n: d for n, d in resultados.items() if d is not None}
+        }), 503
+
+    sin_datos = [n for n in nombres if resultados[n] is None]
+    if sin_datos:
+        return jsonify({'error': f"Datos insuficientes: {', '.join(sin_datos)}"}), 404
+    return jsonify({n: resultados[n] for n in nombres})
 
 # ============================================================
 #  MÓDULOS DE INTELIGENCIA ARTIFICIAL
@@ -547,19 +514,28 @@ def reporte_lima():
 @app.route('/prediccion-2026')
 @login_required
 def prediccion_2026():
-    total, etiquetas, valores, _, _ = predecir_total_2026(col)
-    return render_template('prediccion_2026.html', total=total, etiquetas=etiquetas, valores=valores)
+    return render_template('prediccion_2026.html', **datos_prediccion_2026())
 
 @app.route('/agente-estrategico')
 @login_required
-def agente_estrategico():
+async def agente_estrategico():
     try:
-        total_2026, texto_historico = obtener_contexto_ia(col)
-        analisis_ia = consultar_estratega_ia(total_2026, texto_historico, "Tendencia Extorsión/Homicidio")
+        pron = await en_hilo(obtener_pronostico, rollup())
+        total_2026, texto_historico = pron["total"], pron["texto_contexto"]
+        analisis_ia = await en_hilo(consultar_estratega_ia, total_2026, texto_historico, "Tendencia Extorsión/Homicidio")
         return render_template('agente_estrategico.html', total="{:,}".format(total_2026), analisis=analisis_ia)
     except:
         return render_template('agente_estrategico.html', total="Calculando...", analisis="IA Reiniciando...")
 
+def datos_riesgo_modalidad(modalidad="Extorsión"):
+    # Tendencia nacional (gráfico de línea) del histórico del modelo de riesgo
+    modelo, df_hist, le_dpto = obtener_modelo_riesgo(rollup(), modalidad)
+    if df_hist is None or df_hist.empty:
+        return None
+    df_nacional = df_hist.groupby(['periodo', 'anio', 'trimestre_num'])['total'].sum().reset_index()
+    df_nacional = df_nacional.sort_values(by=['anio', 'trimestre_num'])
+    return {"modalidad": modalidad, "labels": df_nacional['periodo'].tolist(), "valores": df_nacional['total'].tolist()}
+
 @app.route('/riesgo-modalidad', methods=['GET', 'POST'])
 @login_required
 def riesgo_modalidad():
@@ -567,24 +543,14 @@ def riesgo_modalidad():
     anio_sim, trim_sim, dpto_sim = 2025, "T1", "LIMA METROPOLITANA"
     resultado_sim, analisis_ia_txt = 0, None
     
-    # 1. INICIALIZAR VARIABLES DE GRÁFICO (¡Esto faltaba!)
-    grafico_labels = []
-    grafico_data = []
     deptos_list = []
     anios_list = []
 
-    # 2. Entrenar modelo y obtener datos históricos
-    modelo, df_hist, le_dpto = entrenar_modelo_riesgo(col, modalidad)
+    # Obtener modelo (cacheado por versión de datos) y datos históricos.
+    # El gráfico se pide aparte a /api/graficos/riesgo-modalidad
+    modelo, df_hist, le_dpto = obtener_modelo_riesgo(rollup(), modalidad)
     
-    # 3. Si hay datos históricos, llenamos las listas del gráfico
     if not df_hist.empty:
-        # Agrupamos datos para el gráfico de línea (Tendencia Nacional)
-        df_nacional = df_hist.groupby(['periodo', 'anio', 'trimestre_num'])['total'].sum().reset_index()
-        df_nacional = df_nacional.sort_values(by=['anio', 'trimestre_num'])
-        
-        grafico_labels = df_nacional['periodo'].tolist()
-        grafico_data = df_nacional['total'].tolist()
-        
         deptos_list = sorted(df_hist['departamento'].unique().tolist())
         anios_list = sorted(df_hist['anio'].unique().tolist())
         if 2026 not in anios_list: anios_list.append(2026)
@@ -610,85 +576,119 @@ def riesgo_modalidad():
                            entrada={"anio": anio_sim, "trimestre": trim_sim, "departamento": dpto_sim},
                            resultado=resultado_sim, 
                            analisis_ia=analisis_ia_txt,
-                           # PASAMOS LAS VARIABLES DE GRÁFICO SEGURAS
-                           labels=grafico_labels, 
-                           valores=grafico_data)
+                           modalidad=modalidad)
+
+@app.route('/api/riesgo-modalidad/prediccion-lote', methods=['POST'])
+@login_required
+def prediccion_lote():
+    """
+    Grilla completa de predicciones en una sola petición (para el simulador o un heatmap).
+    JSON de entrada (todo opcional): {"modalidad", "anios", "trimestres", "departamentos"}.
+    """
+    params = request.get_json(silent=True)
+    if params is None:
+        params = {}
+    if not isinstance(params, dict):
+        return jsonify({'error': "El cuerpo debe ser un objeto JSON."}), 400
+
+    modalidad = params.get('modalidad') or "Extorsión"
+    # Solo modalidades que existen: cada una entrena (y guarda) su propio modelo
+    conocidas = {d["_id"] for d in snapshot_dashboard(rollup())["por_modalidad"]}
+    if not isinstance(modalidad, str) or modalidad not in conocidas:
+        return jsonify({'error': "Modalidad desconocida."}), 400
+
+    modelo, df_hist, le_dpto = obtener_modelo_riesgo(rollup(), modalidad)
+    if not modelo:
+        return jsonify({'error': f"No hay datos para la modalidad '{modalidad}'."}), 404
+
+    # Los filtros deben ser listas: un texto suelto se iteraría letra por letra
+    for campo in ('anios', 'trimestres', 'departamentos'):
+        if params.get(campo) is not None and not isinstance(params[campo], list):
+            return jsonify({'error': f"'{campo}' debe ser una lista."}), 400
+
+    try:
+        anios = [int(a) for a in params.get('anios') or sorted(df_hist['anio'].unique().tolist()) + [2026]]
+        trimestres = params.get('trimestres') or ["T1", "T2", "T3", "T4"]
+        departamentos = params.get('departamentos') or le_dpto.classes_.tolist()
+    except (TypeError, ValueError):
+        return jsonify({'error': "Parámetros inválidos."}), 400
+
+    if len(anios) > 20:
+        return jsonify({'error': "Máximo 20 años por consulta."}), 400
+
+    filas, desconocidos = predecir_lote(modelo, le_dpto, sorted(set(anios)), trimestres, departamentos)
+    return jsonify({
+        'modalidad': modalidad,
+        'resultados': filas,
+        'departamentos_desconocidos': desconocidos
+    })
 
 # ============================================================
 # CHATBOT IA: CONTEXTO INTELIGENTE (MEJORADO)
 # ============================================================
+# Departamentos que reconoce el chat en el mensaje del usuario
+# (grupos de la dimensión: "LIMA" y "CALLAO" agrupan sus variantes)
+DEPTOS_CLAVE_CHAT = GRUPOS
+
+def _contexto_anual():
+    # A. Histórico Anual (snapshot del dashboard: solo cambia con el ETL)
+    datos_anual = snapshot_dashboard(rollup())["por_anio"]
+    txt_anual = ", ".join([f"{d['_id']}: {d['total']:,}" for d in datos_anual if str(d['_id']).isdigit()])
+    return f"HISTORIAL NACIONAL POR AÑO: {txt_anual}.\n"
+
+def _contexto_top_nacional():
+    # B. Top 5 Modalidades (Nacional) - Para que sepa de qué delitos hablamos
+    datos_mod = snapshot_dashboard(rollup())["por_modalidad"][:5]
+    txt_mod = ", ".join([f"{d['_id']} ({d['total']:,})" for d in datos_mod])
+    return f"TOP 5 DELITOS (NACIONAL): {txt_mod}.\n"
+
+async def _contexto_departamento(depto_detectado):
+    # Consulta a MongoDB filtrando por ese departamento
+    pipeline_local = [
+        # DPTO_GRUPO (normalizado en el ETL): "LIMA" agrupa "LIMA METROPOLITANA" y "REGION LIMA"
+        {"$match": {"DPTO_GRUPO": depto_detectado}},
+        {"$group": {"_id": "$P_MODALIDADES", "total": {"$sum": "$cantidad"}}},
+        {"$sort": {"total": -1}},
+        {"$limit": 3} # Traemos los 3 delitos más comunes de esa zona
+    ]
+    datos_local = await agregar_async(rollup(), pipeline_local)
+
+    if datos_local:
+        txt_local = ", ".join([f"{d['_id']} ({d['total']:,})" for d in datos_local])
+        return (f"\n--- DATOS ESPECÍFICOS PARA '{depto_detectado}' ---\n"
+                f"Principales delitos en esta región: {txt_local}.\n")
+    return f"\n(Nota: No se encontraron datos específicos para {depto_detectado} en la BD).\n"
+
 @app.route('/chat-ia', methods=['POST'])
 @login_required
-def chat_ia():
+async def chat_ia():
     mensaje = request.form.get('mensaje', '').strip()
     if not mensaje: return jsonify({'respuesta': "No entendí."})
     
     try:
-        col = db['denuncias']
         contexto_acumulado = "ERES UN ANALISTA DE INTELIGENCIA POLICIAL (SIDPOL).\n"
-        
+
         # -----------------------------------------------------
-        # 1. CONTEXTO GENERAL (Siempre se envía)
+        # 1. DETECCIÓN INTELIGENTE (¿El usuario habla de un lugar?)
         # -----------------------------------------------------
-        # A. Histórico Anual
-        pipeline_anual = [{"$group": {"_id": "$ANIO", "total": {"$sum": "$cantidad"}}}, {"$sort": {"_id": 1}}]
-        datos_anual = list(col.aggregate(pipeline_anual))
-        txt_anual = ", ".join([f"{d['_id']}: {d['total']:,}" for d in datos_anual if str(d['_id']).isdigit()])
-        contexto_acumulado += f"HISTORIAL NACIONAL POR AÑO: {txt_anual}.\n"
-
-        # B. Top 5 Modalidades (Nacional) - Para que sepa de qué delitos hablamos
-        pipeline_mod = [
-            {"$group": {"_id": "$P_MODALIDADES", "total": {"$sum": "$cantidad"}}},
-            {"$sort": {"total": -1}},
-            {"$limit": 5}
-        ]
-        datos_mod = list(col.aggregate(pipeline_mod))
-        txt_mod = ", ".join([f"{d['_id']} ({d['total']:,})" for d in datos_mod])
-        contexto_acumulado += f"TOP 5 DELITOS (NACIONAL): {txt_mod}.\n"
+        mensaje_upper = mensaje.upper()
+        depto_detectado = next((d for d in DEPTOS_CLAVE_CHAT if d in mensaje_upper), None)
 
         # -----------------------------------------------------
-        # 2. DETECCIÓN INTELIGENTE (¿El usuario habla de un lugar?)
+        # 2. CONTEXTO EN PARALELO: general (siempre) + departamento (si aplica)
         # -----------------------------------------------------
-        deptos_clave = [
-            "AMAZONAS", "ANCASH", "APURIMAC", "AREQUIPA", "AYACUCHO", "CAJAMARCA", 
-            "CALLAO", "CUSCO", "HUANCAVELICA", "HUANUCO", "ICA", "JUNIN", "LA LIBERTAD", 
-            "LAMBAYEQUE", "LIMA", "LORETO", "MADRE DE DIOS", "MOQUEGUA", "PASCO", 
-            "PIURA", "PUNO", "SAN MARTIN", "TACNA", "TUMBES", "UCAYALI"
-        ]
-        
-        mensaje_upper = mensaje.upper()
-        depto_detectado = None
-        
-        # Buscamos si el mensaje contiene algún departamento
-        for d in deptos_clave:
-            if d in mensaje_upper:
-                depto_detectado = d
-                break 
-        
-        # SI ENCONTRAMOS UN LUGAR, BUSCAMOS SU DATA ESPECÍFICA
+        tareas = [en_hilo(_contexto_anual), en_hilo(_contexto_top_nacional)]
         if depto_detectado:
-            # Consulta a MongoDB filtrando por ese departamento
-            pipeline_local = [
-                # Usamos regex para que "LIMA" coincida con "LIMA METROPOLITANA" o "REGION LIMA"
-                {"$match": {"DPTO_HECHO_NEW": {"$regex": depto_detectado, "$options": "i"}}},
-                {"$group": {"_id": "$P_MODALIDADES", "total": {"$sum": "$cantidad"}}},
-                {"$sort": {"total": -1}},
-                {"$limit": 3} # Traemos los 3 delitos más comunes de esa zona
-            ]
-            datos_local = list(col.aggregate(pipeline_local))
-            
-            if datos_local:
-                txt_local = ", ".join([f"{d['_id']} ({d['total']:,})" for d in datos_local])
-                contexto_acumulado += f"\n--- DATOS ESPECÍFICOS PARA '{depto_detectado}' ---\n"
-                contexto_acumulado += f"Principales delitos en esta región: {txt_local}.\n"
-            else:
-                contexto_acumulado += f"\n(Nota: No se encontraron datos específicos para {depto_detectado} en la BD).\n"
+            tareas.append(_contexto_departamento(depto_detectado))
+
+        for parte in await reunir(*tareas):
+            contexto_acumulado += parte
 
         # -----------------------------------------------------
         # 3. CONSULTA A GEMINI (Con toda la info nueva)
         # -----------------------------------------------------
         # Se envía el mensaje del usuario + el contexto enriquecido
-        respuesta = consultar_chat_general(mensaje, contexto_datos=contexto_acumulado)
+        respuesta = await en_hilo(consultar_chat_general, mensaje, contexto_datos=contexto_acumulado)
         return jsonify({'respuesta': respuesta})
 
     except Exception as e:
@@ -708,18 +708,58 @@ def crear_usuario():
         rol = request.form['rol']
         
         users_col = db['usuarios']
-        if users_col.find_one({"username": username}):
+        if users_col.find_one({"username": username}, {"_id": 1}):
             flash('Usuario ya existe.', 'error')
-        else:
+            return render_template('crear_usuario.html')
+        try:
+            # Respaldo: el índice único sobre 'username' (si ya se creó) cubre
+            # dos altas simultáneas del mismo usuario
             users_col.insert_one({
                 "username": username,
                 "password": generate_password_hash(password),
                 "rol": rol
             })
+        except DuplicateKeyError:
+            flash('Usuario ya existe.', 'error')
+        else:
+            invalidar_usuario(username)
             flash(f'Usuario {username} creado.', 'success')
             return redirect(url_for('crear_usuario'))
             
     return render_template('crear_usuario.html')
 
+# ============================================================
+#  MONITOREO
+# ============================================================
+@app.route('/admin/refrescar-pronostico', methods=['POST'])
+@login_required
+@admin_required
+def admin_refrescar_pronostico():
+    pron = calcular_pronostico(rollup(), forzar=True)
+    return jsonify({
+        "version": pron["version"],
+        "calculado": pron["calculado"].strftime("%Y-%m-%d %H:%M:%S"),
+        "total": pron["total"]
+    })
+
+@app.route('/admin/indices')
+@login_required
+@admin_required
+def admin_indices():
+    # Planes de los pipelines que la app ejecutó desde que arrancó
+    return jsonify(reporte_explain(pipelines_registrados()))
+
+@app.route('/admin/cache')
+@login_required
+@admin_required
+def admin_cache():
+    return jsonify(estadisticas_cache())
+
+@app.route('/admin/mongo-pool')
+@login_required
+@admin_required
+def admin_mongo_pool():
+    return jsonify(metricas_pool())
+
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -1,5 +1,5 @@
 import os
-from pymongo import MongoClient
+from mongo_cliente import obtener_cliente
 from dotenv import load_dotenv
 
 # 1. Cargar configuración
@@ -13,7 +13,7 @@ if not uri_nube:
 print("🔌 Conectando a la Nube para corregir nombres...")
 
 try:
-    client = MongoClient(uri_nube)
+    client = obtener_cliente(uri_nube)
     db = client['denuncias_db']
     col = db['denuncias']
 
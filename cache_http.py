@@ -0,0 +1,69 @@
+# cache_http.py
+# Cabeceras de caché HTTP (ETag / Last-Modified) ligadas a la versión de datos.
+#
+# Los datos de los gráficos solo cambian cuando corre el ETL, así que la
+# versión de datos basta como validador: si el navegador ya tiene la versión
+# vigente se responde 304 sin tocar Mongo ni armar el JSON.
+import hashlib
+from datetime import timezone
+from functools import wraps
+from flask import current_app, request, make_response
+
+from mongo_cache import leer_marca_datos
+
+
+def _etag(version, extra=None):
+    # La URL completa (con parámetros) distingue, p. ej., dos consultas a /reporte
+    texto = f"{version}|{request.full_path}|{extra}"
+    return "v%s-%s" % (version, hashlib.sha1(texto.encode("utf-8")).hexdigest()[:16])
+
+
+def _en_utc(fecha):
+    # 'actualizado' se guarda sin zona horaria; se trata igual en cada petición
+    if fecha is None:
+        return None
+    return fecha.replace(microsecond=0, tzinfo=fecha.tzinfo or timezone.utc)
+
+
+def _no_modificado(etag, ultima):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if ultima is not None and request.if_modified_since is not None:
+        return request.if_modified_since >= ultima
+    return False
+
+
+def cache_por_version(db, extra=None):
+    """
+    Decorador para vistas JSON: agrega ETag y Last-Modified según la versión
+    de datos y responde 304 antes de ejecutar la vista si el cliente ya la tiene.
+    Las respuestas son 'private, no-cache': solo las guarda el navegador del
+    usuario (las rutas requieren login) y siempre se revalidan.
+    'extra(*args, **kwargs)' agrega al ETag lo que la vista sirve con otra
+    versión propia (p. ej. el pronóstico, que se recalcula después del ETL);
+    si devuelve algo distinto de None no se usa Last-Modified.
+    """
+    def decorador(f):
+        @wraps(f)
+        def envoltura(*args, **kwargs):
+            version, actualizado = leer_marca_datos(db)
+            adicional = extra(*args, **kwargs) if extra else None
+            etag = _etag(version, adicional)
+            ultima = _en_utc(actualizado) if adicional is None else None
+
+            if _no_modificado(etag, ultima):
+                resp = make_response("", 304)
+            else:
+                # ensure_sync: la vista puede ser async
+                resp = make_response(current_app.ensure_sync(f)(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+
+            resp.set_etag(etag)
+            if ultima is not None:
+                resp.last_modified = ultima
+            resp.cache_control.private = True
+            resp.cache_control.no_cache = True
+            return resp
+        return envoltura
+    return decorador
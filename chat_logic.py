@@ -7,7 +7,7 @@ from mongo_queries import (
     top_modalidades,
     ranking_departamentos,
     tendencia_modalidad,
-    comparar_dos_anios,
+    totales_lote,
 )
 
 def construir_contexto(col, mensaje):
@@ -61,18 +61,18 @@ def construir_contexto(col, mensaje):
         for p in serie:
             contexto += f"- Año {p['_id']}: {p['total']} denuncias.\n"
 
-    # 5) Comparación entre dos años (cuando existan dos años en el texto)
+    # 5) Comparación entre años (cuando existan dos o más años en el texto)
     elif intencion == "comparacion" and departamento and modalidad:
-        anios = re.findall(r"(2018|2019|2020|2021|2022|2023|2024|2025|2026)", mensaje)
+        anios = list(dict.fromkeys(int(a) for a in re.findall(r"(2018|2019|2020|2021|2022|2023|2024|2025|2026)", mensaje)))
         if len(anios) >= 2:
-            a1, a2 = int(anios[0]), int(anios[1])
-            t1, t2 = comparar_dos_anios(col, departamento, modalidad, a1, a2)
+            # Todos los años en una sola consulta
+            totales = totales_lote(col, [(a, departamento, modalidad) for a in anios])
             contexto = (
                 "Comparación de denuncias según la base de datos:\n"
                 f"Departamento: {departamento}, Modalidad: {modalidad}.\n"
-                f"- {a1}: {t1} denuncias.\n"
-                f"- {a2}: {t2} denuncias.\n"
             )
+            for a in anios:
+                contexto += f"- {a}: {totales[(a, departamento, modalidad)]} denuncias.\n"
 
     # Si no se reconoce la intención o faltan datos:
     if not contexto:
@@ -0,0 +1,122 @@
+# departamentos_dim.py
+# Dimensión canónica de departamentos: ÚNICA fuente para nombres, variantes,
+# código del mapa (Highcharts), región natural, agrupación y población.
+#
+# regiones_peru.py, poblacion_peru.py, nlp_consulta.py, normalizacion.py y
+# las rutas de app.py leen de aquí. 'codigo' es el nombre tal como viene en
+# DPTO_HECHO_NEW (SIDPOL).
+import re
+import unicodedata
+
+# Poblaciones aproximadas (INEI)
+DEPARTAMENTOS = [
+    # --- COSTA ---
+    {"codigo": "TUMBES", "mapa": "pe-tu", "region": "Costa", "poblacion": 280723},
+    {"codigo": "PIURA", "mapa": "pe-pi", "region": "Costa", "poblacion": 2138730},
+    {"codigo": "LAMBAYEQUE", "mapa": "pe-lb", "region": "Costa", "poblacion": 1367029},
+    {"codigo": "LA LIBERTAD", "mapa": "pe-ll", "region": "Costa", "poblacion": 2078028},
+    {"codigo": "ANCASH", "mapa": "pe-an", "region": "Costa", "poblacion": 1202828},
+    # Lima Ciudad ('pe-li') y Lima Provincias ('pe-lr') se reportan juntas como "LIMA"
+    {"codigo": "LIMA METROPOLITANA", "mapa": "pe-li", "region": "Costa", "poblacion": 11810722,
+     "grupo": "LIMA", "variantes": ["LIMA"]},
+    {"codigo": "REGION LIMA", "mapa": "pe-lr", "region": "Costa", "poblacion": 1092827,
+     "grupo": "LIMA", "variantes": ["LIMA PROVINCIAS"]},
+    {"codigo": "PROV. CONST. DEL CALLAO", "mapa": "pe-cl", "region": "Costa", "poblacion": 1147628,
+     "grupo": "CALLAO", "variantes": ["CALLAO"]},
+    {"codigo": "ICA", "mapa": "pe-ic", "region": "Costa", "poblacion": 1004829},
+    {"codigo": "AREQUIPA", "mapa": "pe-ar", "region": "Costa", "poblacion": 1523839},
+    {"codigo": "MOQUEGUA", "mapa": "pe-mq", "region": "Costa", "poblacion": 200973},
+    {"codigo": "TACNA", "mapa": "pe-ta", "region": "Costa", "poblacion": 397737},
+
+    # --- SIERRA ---
+    {"codigo": "CAJAMARCA", "mapa": "pe-cj", "region": "Sierra", "poblacion": 1503836},
+    {"codigo": "HUANUCO", "mapa": "pe-hc", "region": "Sierra", "poblacion": 782039},
+    {"codigo": "PASCO", "mapa": "pe-pa", "region": "Sierra", "poblacion": 278028},
+    {"codigo": "JUNIN", "mapa": "pe-ju", "region": "Sierra", "poblacion": 1418738},
+    {"codigo": "HUANCAVELICA", "mapa": "pe-hv", "region": "Sierra", "poblacion": 371038},
+    {"codigo": "AYACUCHO", "mapa": "pe-ay", "region": "Sierra", "poblacion": 671182},
+    {"codigo": "APURIMAC", "mapa": "pe-ap", "region": "Sierra", "poblacion": 436820},
+    {"codigo": "CUSCO", "mapa": "pe-cs", "region": "Sierra", "poblacion": 1428028},
+    {"codigo": "PUNO", "mapa": "pe-pu", "region": "Sierra", "poblacion": 1268093},
+
+    # --- SELVA ---
+    {"codigo": "AMAZONAS", "mapa": "pe-am", "region": "Selva", "poblacion": 458022},
+    {"codigo": "LORETO", "mapa": "pe-lo", "region": "Selva", "poblacion": 1138637},
+    {"codigo": "SAN MARTIN", "mapa": "pe-sm", "region": "Selva", "poblacion": 924292},
+    {"codigo": "UCAYALI", "mapa": "pe-uc", "region": "Selva", "poblacion": 568028},
+    {"codigo": "MADRE DE DIOS", "mapa": "pe-md", "region": "Selva", "poblacion": 184083},
+]
+
+REGIONES = ["Costa", "Sierra", "Selva"]
+
+for _d in DEPARTAMENTOS:
+    _d.setdefault("grupo", _d["codigo"])
+    _d.setdefault("variantes", [])
+
+
+def normalizar_texto(texto):
+    """Mayúsculas, sin tildes y con espacios simples."""
+    if texto is None or texto != texto:  # None o NaN
+        return ""
+    texto = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode()
+    return re.sub(r"\s+", " ", texto).strip().upper()
+
+
+# Índice: nombre normalizado (código o variante) -> fila de la dimensión
+_INDICE = {}
+for _d in DEPARTAMENTOS:
+    for _nombre in [_d["codigo"]] + _d["variantes"]:
+        _INDICE[normalizar_texto(_nombre)] = _d
+
+POR_CODIGO = {d["codigo"]: d for d in DEPARTAMENTOS}
+CODIGOS = [d["codigo"] for d in DEPARTAMENTOS]
+GRUPOS = sorted({d["grupo"] for d in DEPARTAMENTOS})
+
+
+def buscar_departamento(nombre):
+    """Fila de la dimensión para un nombre de la BD (o una variante), o None."""
+    return _INDICE.get(normalizar_texto(nombre))
+
+
+# ==========================================
+# VISTAS DEPARTAMENTALES (UNA SOLA PASADA)
+# ==========================================
+
+def vistas_departamentales(datos, poblacion_default=1000000):
+    """
+    A partir de los totales por DPTO_HECHO_NEW ([{"_id": nombre, "total": n}])
+    arma en una sola pasada las vistas de ranking, mapa, regiones y per cápita.
+    Cada nombre se resuelve contra la dimensión una sola vez.
+    """
+    totales = {}
+    no_mapeados = []
+    for d in datos:
+        if not d.get("_id"):
+            continue
+        fila = buscar_departamento(d["_id"])
+        codigo = fila["codigo"] if fila else normalizar_texto(d["_id"])
+        if not fila:
+            no_mapeados.append(codigo)
+        totales[codigo] = totales.get(codigo, 0) + d["total"]
+
+    for nombre in no_mapeados:
+        # Esto nos ayudará a ver en los logs de Render si algún nombre sigue fallando
+        print(f"⚠️ DEPARTAMENTO FUERA DE LA DIMENSIÓN: {nombre}")
+
+    ranking = sorted(({"_id": c, "total": t} for c, t in totales.items()), key=lambda x: x["total"], reverse=True)
+
+    mapa = [[POR_CODIGO[c]["mapa"], t] for c, t in totales.items() if c in POR_CODIGO]
+
+    acumulado = {r: 0 for r in REGIONES}
+    for c, t in totales.items():
+        if c in POR_CODIGO:
+            acumulado[POR_CODIGO[c]["region"]] += t
+    regiones = sorted(({"_id": r, "total": acumulado[r]} for r in REGIONES), key=lambda x: x["total"], reverse=True)
+
+    percapita = []
+    for c, t in totales.items():
+        pob = POR_CODIGO[c]["poblacion"] if c in POR_CODIGO else poblacion_default  # Default para evitar error div/0
+        percapita.append({"departamento": c, "total": t, "poblacion": pob, "tasa": (t / pob) * 100000})
+    percapita.sort(key=lambda x: x["tasa"], reverse=True)
+
+    return {"ranking": ranking, "mapa": mapa, "regiones": regiones, "percapita": percapita}
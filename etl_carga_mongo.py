@@ -1,5 +1,19 @@
+import os
+import sys
+import time
+import queue
+import itertools
+import threading
+import numpy as np
 import pandas as pd
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne, DeleteMany, ASCENDING
+from pymongo.errors import AutoReconnect, BulkWriteError, NetworkTimeout, OperationFailure
+from rollup_denuncias import construir_rollup, actualizar_rollup, COLECCION_ORIGEN, COLECCION_ROLLUP
+from mongo_cache import incrementar_version_datos, reservar_version_datos
+from snapshot_parquet import escribir_snapshot
+from mongo_cliente import obtener_cliente
+from normalizacion import agregar_campos_normalizados, CAMPOS_NORMALIZADOS
+from indices_mongo import aplicar_indices, aplicar_indices_coleccion, ESPECIFICACION, INDICES_DENUNCIAS
 
 # ========= CONFIGURACIÓN =========
 
@@ -14,6 +28,51 @@ MONGO_URI = "mongodb://localhost:27017"
 DB_NAME = "denuncias_db"
 COLLECTION_NAME = "denuncias"
 
+# Filas leídas del CSV por bloque y documentos por insert_many / bulk_write.
+# La memoria usada queda acotada por TAMANO_BLOQUE, no por el tamaño del CSV.
+TAMANO_BLOQUE = 200_000
+TAMANO_LOTE_INSERCION = 10_000
+
+# Hilos escritores que escriben los lotes en paralelo, y reintentos por lote
+# ante cortes de red. La cola entre lector y escritores es acotada para que
+# el CSV no se lea más rápido de lo que Mongo puede escribir.
+NUM_ESCRITORES = int(os.getenv("ETL_ESCRITORES", 4))
+MAX_REINTENTOS = 3
+
+# Modo de carga (en ambos, las filas con la misma llave suman su 'cantidad'):
+#   "completo"    -> insert_many en una colección de staging y la publica
+#   "incremental" -> upsert por llave de fila desde la última marca de agua
+MODO_CARGA = os.getenv("ETL_MODO", "completo")
+
+# Columnas que NO forman parte de la llave estable de una fila
+COLUMNAS_NO_CLAVE = {"_id", "cantidad", "trimestre", "anio_trimestre", "clave_fila", *CAMPOS_NORMALIZADOS}
+# Carga completa "blue/green": se escribe en una colección de staging y,
+# validada, se renombra atómicamente sobre la colección real. La versión
+# anterior queda en '<colección>_anterior' para poder revertir.
+SUFIJO_STAGING = "_staging"
+SUFIJO_ANTERIOR = "_anterior"
+CONSERVAR_ANTERIOR = os.getenv("ETL_CONSERVAR_ANTERIOR", "1") == "1"
+
+COLECCION_ESTADISTICAS = "estadisticas"
+ID_WATERMARK = "watermark_etl"
+
+# Tipos explícitos de las columnas conocidas (las demás se infieren).
+# 'category' guarda una sola copia de cada nombre repetido. Los enteros son
+# nullables (Int*): una celda vacía queda como <NA> en vez de abortar la lectura.
+DTYPES_CSV = {
+    "ANIO": "Int16",
+    "MES": "Int8",
+    "cantidad": "Int32",
+    "DPTO_HECHO_NEW": "category",
+    "PROV_HECHO": "category",
+    "DIST_HECHO": "category",
+    "P_MODALIDADES": "category",
+}
+
+COLUMNAS_ENTERAS = [c for c, t in DTYPES_CSV.items() if t.startswith("Int")]
+
+TRIMESTRES = ["T1", "T2", "T3", "T4"]
+
 # ========= FUNCIONES AUXILIARES =========
 
 def get_trimestre(mes: int) -> str:
@@ -28,22 +87,41 @@ def get_trimestre(mes: int) -> str:
         return "T4"
 
 
-def cargar_csv_en_dataframe(csv_path: str) -> pd.DataFrame:
-    """Lee el CSV y devuelve un DataFrame de pandas."""
-    print(f"Leyendo CSV: {csv_path} ...")
-    df = pd.read_csv(csv_path)
+def agregar_trimestre(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Crea las columnas 'trimestre' y 'anio_trimestre' de forma vectorizada.
+    Mismo criterio que get_trimestre: cualquier mes fuera de 1-9 (o vacío) cae en T4.
+    """
+    mes = df["MES"].to_numpy(dtype="float64", na_value=np.nan)
+    codigo = np.where((mes >= 1) & (mes <= 9), (mes - 1) // 3, 3).astype("int8")
+    trimestre = pd.Categorical.from_codes(codigo, categories=TRIMESTRES)
+
+    df["trimestre"] = trimestre
+    df["anio_trimestre"] = df["ANIO"].astype(str).str.cat(df["trimestre"].astype(str), sep="-")
+    return df
+
 
-    print("Columnas encontradas:")
-    print(df.columns)
+def leer_csv_por_bloques(csv_path: str, tamano_bloque: int = TAMANO_BLOQUE):
+    """Lee el CSV por bloques y devuelve (generador) cada bloque ya procesado."""
+    print(f"Leyendo CSV por bloques de {tamano_bloque:,} filas: {csv_path} ...")
+    lector = pd.read_csv(csv_path, dtype=DTYPES_CSV, chunksize=tamano_bloque)
 
-    # Asegurar que existen columnas ANIO y MES (ajusta los nombres si difieren)
-    # Si tus columnas se llaman distinto (ej. 'ANIO', 'MES', 'DPTO_HECHO_NEW'), cámbialas aquí.
-    if "ANIO" not in df.columns or "MES" not in df.columns:
-        raise ValueError("El CSV debe tener columnas 'ANIO' y 'MES'. Ajusta el script si tienen otro nombre.")
+    for i, bloque in enumerate(lector):
+        if i == 0:
+            print("Columnas encontradas:")
+            print(bloque.columns)
 
-    # Crear columna de trimestre y año-trimestre
-    df["trimestre"] = df["MES"].apply(get_trimestre)
-    df["anio_trimestre"] = df["ANIO"].astype(str) + "-" + df["trimestre"]
+            # Asegurar que existen columnas ANIO y MES (ajusta los nombres si difieren)
+            # Si tus columnas se llaman distinto (ej. 'ANIO', 'MES', 'DPTO_HECHO_NEW'), cámbialas aquí.
+            if "ANIO" not in bloque.columns or "MES" not in bloque.columns:
+                raise ValueError("El CSV debe tener columnas 'ANIO' y 'MES'. Ajusta el script si tienen otro nombre.")
+
+        yield agregar_campos_normalizados(agregar_trimestre(bloque))
+
+
+def cargar_csv_en_dataframe(csv_path: str) -> pd.DataFrame:
+    """Lee el CSV completo y devuelve un DataFrame de pandas (solo para CSV pequeños)."""
+    df = pd.concat(leer_csv_por_bloques(csv_path), ignore_index=True)
 
     print("Primeras filas del DataFrame después de procesar:")
     print(df.head())
@@ -51,47 +129,492 @@ def cargar_csv_en_dataframe(csv_path: str) -> pd.DataFrame:
     return df
 
 
+def _valor_clave(v) -> str:
+    """Texto canónico de un valor: vacío para nulos, sin '.0' en enteros guardados como float."""
+    if v is None or (not isinstance(v, str) and pd.isna(v)):
+        return ""
+    if isinstance(v, (float, np.floating)) and float(v).is_integer():
+        return str(int(v))
+    return str(v).strip()
+
+
+def _texto_clave(serie: pd.Series) -> np.ndarray:
+    """Columna como textos canónicos (dtype object), sea cual sea el dtype que pandas infirió en el bloque."""
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # Se normalizan las categorías una vez; el código -1 (vacío) toma el "" del final
+        textos = np.array([_valor_clave(v) for v in serie.cat.categories] + [""], dtype=object)
+        return textos[serie.cat.codes.to_numpy()]
+    return np.array([_valor_clave(v) for v in serie.astype(object)], dtype=object)
+
+
+def agregar_clave_fila(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Agrega 'clave_fila': un hash estable de las columnas que identifican la
+    fila (todas menos 'cantidad' y las derivadas). Antes de hashear, cada
+    columna se pasa a texto canónico: así "5", 5 y 5.0 (o un categórico y un
+    object) dan la misma llave aunque pandas infiera otro dtype en otro
+    bloque o en otra carga. Permite hacer upsert de una fila ya existente.
+    """
+    columnas = sorted(c for c in df.columns if c not in COLUMNAS_NO_CLAVE)
+    textos = pd.DataFrame({c: _texto_clave(df[c]) for c in columnas}, index=df.index, dtype=object)
+    hashes = pd.util.hash_pandas_object(textos, index=False).to_numpy()
+    df["clave_fila"] = hashes.astype(str)
+    return df
+
+
+def asegurar_clave_unica(collection):
+    """
+    Crea el índice ÚNICO de 'clave_fila' (antes del primer upsert en la
+    carga incremental; tras fusionar repetidas en el staging). Reemplaza
+    el índice no único de versiones anteriores; si la colección ya tiene
+    llaves repetidas, falla (hay que hacer una carga completa).
+    """
+    info = collection.index_information().get("clave_fila_1")
+    if info is not None and not info.get("unique"):
+        collection.drop_index("clave_fila_1")
+    try:
+        collection.create_index([("clave_fila", ASCENDING)], unique=True)
+    except OperationFailure as e:
+        raise RuntimeError(
+            f"No se pudo crear el índice único de 'clave_fila' en '{collection.name}': {e}. "
+            "Ejecuta una carga completa para reconstruir la colección."
+        ) from e
+
+
+def periodo(df: pd.DataFrame):
+    """Periodo AAAAMM de cada fila (para la marca de agua); 0 si falta el año o el mes."""
+    return (df["ANIO"].astype("Int32") * 100 + df["MES"].astype("Int32")).fillna(0).astype("int32")
+
+
+def leer_watermark(db):
+    doc = db[COLECCION_ESTADISTICAS].find_one({"_id": ID_WATERMARK}) or {}
+    return doc.get("periodo", 0)
+
+
+def guardar_watermark(db, valor: int, reiniciar: bool = False):
+    """En carga incremental la marca solo avanza; una carga completa la fija."""
+    operador = "$set" if reiniciar else "$max"
+    db[COLECCION_ESTADISTICAS].update_one(
+        {"_id": ID_WATERMARK},
+        {operador: {"periodo": int(valor)}, "$currentDate": {"actualizado": True}},
+        upsert=True
+    )
+
+
+def sumar_por_clave(df: pd.DataFrame) -> pd.DataFrame:
+    """Una fila por 'clave_fila': las repetidas dentro del bloque suman su 'cantidad'."""
+    if not df["clave_fila"].duplicated().any():
+        return df
+    agregados = {c: "first" for c in df.columns if c != "clave_fila"}
+    if "cantidad" in df.columns:
+        agregados["cantidad"] = "sum"
+    # Mismas llaves -> mismas columnas de la llave (y derivadas): 'first' no pierde nada
+    return df.groupby("clave_fila", sort=False, observed=True).agg(agregados).reset_index()
+
+
+def _preparar_bloques(bloques, resumen, desde_periodo: int = 0):
+    """
+    Agrega la llave de fila, descarta lo anterior a 'desde_periodo', anota en
+    'resumen' los años tocados, el último periodo visto y los totales leídos
+    (filas y suma de 'cantidad') para validar la carga, y suma las filas
+    repetidas del bloque.
+    """
+    for bloque in bloques:
+        per = periodo(bloque)
+        if desde_periodo:
+            bloque = bloque[per >= desde_periodo]
+            per = per[per >= desde_periodo]
+        if bloque.empty:
+            continue
+
+        bloque = agregar_clave_fila(bloque.copy())
+        resumen["anios"].update(int(a) for a in bloque["ANIO"].dropna().unique())
+        resumen["max_periodo"] = max(resumen["max_periodo"], int(per.max()))
+        resumen["filas"] += len(bloque)
+        if "cantidad" in bloque.columns:
+            resumen["cantidad"] += int(bloque["cantidad"].sum(skipna=True))
+        yield sumar_por_clave(bloque)
+
+
+def _separar_repetidas(bloques, repetidas):
+    """
+    Carga incremental: las llaves que ya llegaron en un bloque anterior se
+    apartan en 'repetidas' (se suman con $inc al final, ver sumar_repetidas);
+    así cada llave recibe un solo $set por carga.
+    """
+    vistas = set()
+    for bloque in bloques:
+        ya_vista = bloque["clave_fila"].isin(vistas)
+        if ya_vista.any():
+            repetidas.append(bloque[ya_vista])
+            bloque = bloque[~ya_vista]
+        vistas.update(bloque["clave_fila"])
+        if not bloque.empty:
+            yield bloque
+
+
 def conectar_mongo(uri: str) -> MongoClient:
-    """Devuelve un cliente de MongoDB conectado."""
+    """Devuelve el cliente compartido de MongoDB (mongo_cliente.py) para la URI."""
     print(f"Conectando a MongoDB en {uri} ...")
-    client = MongoClient(uri)
+    client = obtener_cliente(uri)
     print("Conexión a MongoDB OK.")
     return client
 
 
-def cargar_dataframe_a_mongo(df: pd.DataFrame, client: MongoClient, db_name: str, collection_name: str):
-    """Inserta los registros del DataFrame en MongoDB."""
+def _lotes(bloques, tamano_lote: int = TAMANO_LOTE_INSERCION):
+    """Parte cada bloque en sub-DataFrames de a 'tamano_lote' filas."""
+    for bloque in bloques:
+        for inicio in range(0, len(bloque), tamano_lote):
+            yield bloque.iloc[inicio:inicio + tamano_lote]
+
+
+def _registros(lote: pd.DataFrame):
+    """Filas del lote como dicts; los enteros vacíos (<NA>) van como None (BSON no codifica pd.NA)."""
+    vacios = [c for c in COLUMNAS_ENTERAS if c in lote.columns and lote[c].hasnans]
+    if vacios:
+        lote = lote.astype({c: object for c in vacios})
+        lote[vacios] = lote[vacios].where(lote[vacios].notna(), None)
+    return lote.to_dict(orient="records")
+
+
+def _insertar_lote(collection, registros, stats, lock):
+    """insert_many con reintentos. Devuelve cuántos documentos quedaron escritos."""
+    for intento in range(MAX_REINTENTOS + 1):
+        try:
+            result = collection.insert_many(registros, ordered=False)
+            return len(result.inserted_ids)
+        except BulkWriteError as e:
+            # En un reintento, los documentos que ya habían llegado (mismo _id)
+            # fallan por clave duplicada: eso cuenta como escrito.
+            errores = e.details.get("writeErrors", [])
+            if intento > 0 and all(err.get("code") == 11000 for err in errores):
+                return e.details.get("nInserted", 0) + len(errores)
+            raise
+        except (AutoReconnect, NetworkTimeout):
+            if intento == MAX_REINTENTOS:
+                raise
+            with lock:
+                stats["reintentos"] += 1
+            time.sleep(2 ** intento)
+
+
+def _upsert_lote(collection, registros, stats, lock):
+    """
+    Upsert por 'clave_fila' (índice único). Las filas sin cambios (misma
+    'cantidad' y campos) no generan escritura: Mongo no modifica un
+    documento si el $set deja los mismos valores.
+    """
+    operaciones = [UpdateOne({"clave_fila": r["clave_fila"]}, {"$set": r}, upsert=True) for r in registros]
+    for intento in range(MAX_REINTENTOS + 1):
+        try:
+            result = collection.bulk_write(operaciones, ordered=False)
+            with lock:
+                stats["nuevos"] += result.upserted_count
+                stats["modificados"] += result.modified_count
+            return len(registros)
+        except (AutoReconnect, NetworkTimeout):
+            # Los upserts con $set son idempotentes: reintentar es seguro
+            if intento == MAX_REINTENTOS:
+                raise
+            with lock:
+                stats["reintentos"] += 1
+            time.sleep(2 ** intento)
+
+
+def sumar_repetidas(collection, repetidas, stats):
+    """
+    Suma con $inc las filas de 'repetidas' (llaves que ya recibieron su $set
+    en esta carga). Corre al terminar los escritores, así el $set va antes.
+    Sin reintentos manuales: $inc no es idempotente (el driver ya reintenta
+    una vez de forma segura con retryWrites).
+    """
+    if not repetidas:
+        return
+    df = pd.concat(repetidas, ignore_index=True)
+    totales = df.groupby("clave_fila", sort=False)["cantidad"].sum() if "cantidad" in df.columns else None
+    if totales is None or totales.empty:
+        return
+    operaciones = [UpdateOne({"clave_fila": k}, {"$inc": {"cantidad": int(v)}}) for k, v in totales.items() if v]
+    for inicio in range(0, len(operaciones), TAMANO_LOTE_INSERCION):
+        result = collection.bulk_write(operaciones[inicio:inicio + TAMANO_LOTE_INSERCION], ordered=False)
+        stats["modificados"] += result.modified_count
+    stats["filas"] += len(df)
+    print(f"Llaves repetidas entre bloques sumadas: {len(totales):,}.")
+
+
+def fusionar_claves_repetidas(collection):
+    """
+    Carga completa: cada bloque ya viene sumado por llave, pero una llave
+    puede repetirse en dos bloques. Se deja un documento por 'clave_fila'
+    (con la 'cantidad' total) para poder crear el índice único.
+    """
+    # Una sola pasada (aún no hay índice de 'clave_fila'): ids y total por llave
+    repetidas = collection.aggregate([
+        {"$group": {"_id": "$clave_fila", "ids": {"$push": "$_id"}, "total": {"$sum": "$cantidad"}}},
+        {"$match": {"ids.1": {"$exists": True}}},
+    ], allowDiskUse=True)
+
+    operaciones, fusionadas = [], 0
+    for grupo in repetidas:
+        primero, *resto = grupo["ids"]
+        operaciones.append(UpdateOne({"_id": primero}, {"$set": {"cantidad": grupo["total"]}}))
+        operaciones.append(DeleteMany({"_id": {"$in": resto}}))
+        fusionadas += 1
+        if len(operaciones) >= TAMANO_LOTE_INSERCION:
+            collection.bulk_write(operaciones, ordered=False)
+            operaciones = []
+    if operaciones:
+        collection.bulk_write(operaciones, ordered=False)
+    if fusionadas:
+        print(f"Llaves repetidas entre bloques fusionadas: {fusionadas:,}.")
+
+
+def _escritor(collection, cola, stats, lock, escribir=_insertar_lote):
+    """Hilo escritor: toma lotes de la cola, los convierte y los escribe."""
+    while True:
+        lote = cola.get()
+        try:
+            if lote is None:
+                return
+            if stats["error"]:
+                continue  # Ya falló otro escritor: solo vaciamos la cola
+            escritos = escribir(collection, _registros(lote), stats, lock)
+            with lock:
+                stats["filas"] += escritos
+                stats["lotes"] += 1
+        except Exception as e:
+            with lock:
+                stats["error"] = stats["error"] or e
+        finally:
+            cola.task_done()
+
+
+def insertar_en_paralelo(collection, bloques, num_escritores: int = NUM_ESCRITORES, escribir=_insertar_lote):
+    """
+    Pipeline lectura -> transformación -> escritura: este hilo lee y parte
+    los bloques del CSV mientras 'num_escritores' hilos escriben en Mongo
+    (insert_many, o _upsert_lote en la carga incremental).
+    Devuelve las estadísticas de la carga.
+    """
+    stats = {"filas": 0, "lotes": 0, "reintentos": 0, "nuevos": 0, "modificados": 0, "error": None, "segundos": 0.0}
+    lock = threading.Lock()
+    cola = queue.Queue(maxsize=num_escritores * 2)
+    inicio = time.perf_counter()
+
+    hilos = [
+        threading.Thread(target=_escritor, args=(collection, cola, stats, lock, escribir), name=f"etl-escritor-{i}", daemon=True)
+        for i in range(num_escritores)
+    ]
+    for h in hilos:
+        h.start()
+
+    try:
+        for lote in _lotes(bloques):
+            if stats["error"]:
+                break
+            cola.put(lote)
+    finally:
+        for _ in hilos:
+            cola.put(None)
+        for h in hilos:
+            h.join()
+
+    stats["segundos"] = time.perf_counter() - inicio
+    if stats["error"]:
+        raise RuntimeError(f"Falló la inserción en paralelo: {stats['error']}")
+    return stats
+
+
+def imprimir_reporte(stats):
+    segundos = max(stats["segundos"], 1e-9)
+    print("----- Reporte de carga -----")
+    print(f"Filas escritas   : {stats['filas']:,}")
+    print(f"Lotes            : {stats['lotes']:,}")
+    print(f"Reintentos       : {stats['reintentos']:,}")
+    if stats["nuevos"] or stats["modificados"]:
+        print(f"Upserts nuevos   : {stats['nuevos']:,}")
+        print(f"Modificados      : {stats['modificados']:,}")
+    print(f"Tiempo           : {stats['segundos']:.1f} s")
+    print(f"Throughput       : {stats['filas'] / segundos:,.0f} filas/s")
+
+
+def copiar_indices(origen, destino):
+    """Recrea en 'destino' los índices que ya tiene 'origen' (salvo _id y los que ya existen)."""
+    existentes = set(destino.index_information())
+    for nombre, info in origen.index_information().items():
+        if nombre == "_id_" or nombre in existentes:
+            continue
+        opciones = {k: v for k, v in info.items() if k not in ("key", "v", "ns")}
+        destino.create_index(info["key"], name=nombre, **opciones)
+
+
+def validar_staging(staging, resumen):
+    """
+    Compara conteo y suma de 'cantidad' del staging con lo leído del CSV.
+    Las filas con la misma llave quedan en un solo documento, así que el
+    conteo puede ser menor que las filas leídas, pero la suma debe coincidir.
+    """
+    conteo = staging.count_documents({})
+    res = list(staging.aggregate([{"$group": {"_id": None, "total": {"$sum": "$cantidad"}}}]))
+    suma = res[0]["total"] if res else 0
+
+    if not 0 < conteo <= resumen["filas"] or suma != resumen["cantidad"]:
+        raise RuntimeError(
+            f"Validación fallida en '{staging.name}': {conteo:,} filas / {suma:,} denuncias "
+            f"(esperado hasta {resumen['filas']:,} / {resumen['cantidad']:,}). La colección real no se tocó."
+        )
+    repetidas = resumen["filas"] - conteo
+    print(f"✅ Staging validado: {conteo:,} filas, {suma:,} denuncias"
+          + (f" ({repetidas:,} filas con llave repetida sumadas)." if repetidas else "."))
+
+
+def publicar_staging(db, collection_name: str):
+    """
+    Reemplaza la colección real por el staging. renameCollection con
+    dropTarget es atómico: los lectores ven la versión vieja o la nueva,
+    nunca una a medias.
+    """
+    staging = collection_name + SUFIJO_STAGING
+    anterior = collection_name + SUFIJO_ANTERIOR
+
+    if CONSERVAR_ANTERIOR and collection_name in db.list_collection_names():
+        # Copia de respaldo para rollback (no afecta a los lectores)
+        db[collection_name].aggregate([{"$match": {}}, {"$out": anterior}], allowDiskUse=True)
+        print(f"Respaldo de la versión anterior en '{anterior}'.")
+
+    db[staging].rename(collection_name, dropTarget=True)
+    print(f"🔁 '{staging}' publicado como '{collection_name}'.")
+
+
+def revertir_carga(client: MongoClient, db_name: str, collection_name: str):
+    """Vuelve a publicar la versión anterior guardada por la última carga completa."""
+    db = client[db_name]
+    anterior = collection_name + SUFIJO_ANTERIOR
+    if anterior not in db.list_collection_names():
+        raise RuntimeError(f"No existe '{anterior}': no hay versión anterior para revertir.")
+
+    # El respaldo se hizo con $out (solo tiene _id): se indexa antes de
+    # publicarlo, así un fallo deja intacta la colección real
+    asegurar_clave_unica(db[anterior])
+    aplicar_indices_coleccion(db[anterior], INDICES_DENUNCIAS)
+    db[anterior].rename(collection_name, dropTarget=True)
+    print(f"↩️ '{collection_name}' revertida a la versión anterior.")
+    construir_rollup(db, origen=collection_name)
+
+    # La marca de agua vuelve al último mes de la versión restaurada
+    ultimo = db[COLECCION_ROLLUP].find_one({}, {"ANIO": 1, "MES": 1}, sort=[("ANIO", -1), ("MES", -1)])
+    if ultimo:
+        guardar_watermark(db, int(ultimo["ANIO"]) * 100 + int(ultimo["MES"]), reiniciar=True)
+
+    incrementar_version_datos(db)
+
+
+def cargar_dataframe_a_mongo(datos, client: MongoClient, db_name: str, collection_name: str, modo: str = MODO_CARGA):
+    """
+    Carga los registros en MongoDB. 'datos' puede ser un DataFrame o un
+    iterable de DataFrames (p. ej. leer_csv_por_bloques), que se escribe
+    bloque a bloque sin cargar todo el CSV en memoria.
+
+    modo="completo": escribe en '<colección>_staging', lo valida y lo
+    publica sobre la colección real sin ventana de datos a medias.
+    modo="incremental": solo procesa filas desde la última marca de agua
+    (el último mes cargado se reprocesa por si llegó incompleto) y hace
+    upsert por 'clave_fila' (el índice único se crea antes del primer upsert).
+    En ambos modos las filas con la misma llave se suman: dentro del bloque
+    en pandas (sumar_por_clave) y entre bloques con fusionar_claves_repetidas
+    (completo) o sumar_repetidas (incremental).
+    """
+    if modo not in ("completo", "incremental"):
+        raise ValueError(f"Modo de carga desconocido: {modo}")
+
     db = client[db_name]
     collection = db[collection_name]
 
-    # Opcional: borrar datos anteriores
-    resp = collection.delete_many({})
-    print(f"Documentos eliminados anteriormente en la colección: {resp.deleted_count}")
+    incremental = modo == "incremental"
+    desde = leer_watermark(db) if incremental else 0
+    if incremental:
+        print(f"Modo incremental: procesando filas desde el periodo {desde or 'inicial'}.")
+
+    resumen = {"anios": set(), "max_periodo": 0, "filas": 0, "cantidad": 0}
+    bloques = iter([datos] if isinstance(datos, pd.DataFrame) else datos)
+    bloques = _preparar_bloques(bloques, resumen, desde_periodo=desde)
+
+    # Leemos el primer bloque ANTES de borrar: si el CSV es inválido, la colección queda intacta
+    primero = next(bloques, None)
+    bloques = itertools.chain([primero], bloques) if primero is not None else iter([])
+
+    if incremental:
+        asegurar_clave_unica(collection)
+        aplicar_indices_coleccion(collection, INDICES_DENUNCIAS)
+        repetidas = []
+        stats = insertar_en_paralelo(collection, _separar_repetidas(bloques, repetidas), escribir=_upsert_lote)
+        sumar_repetidas(collection, repetidas, stats)
+    else:
+        # Staging limpio: la colección real sigue sirviendo mientras tanto
+        staging = db[collection_name + SUFIJO_STAGING]
+        staging.drop()
+        stats = insertar_en_paralelo(staging, bloques)
 
-    # Convertir DataFrame a lista de diccionarios (documentos)
-    registros = df.to_dict(orient="records")
+    imprimir_reporte(stats)
+    procesados = stats["filas"]
 
-    if not registros:
-        print("No hay registros para insertar. Revisa el CSV.")
+    if not procesados:
+        print("No hay registros nuevos para cargar. Revisa el CSV.")
         return
 
-    print(f"Insertando {len(registros)} documentos en MongoDB...")
-    result = collection.insert_many(registros)
-    print(f"Insertados {len(result.inserted_ids)} documentos en la colección '{collection_name}'.")
+    print(f"Procesados {procesados:,} documentos en la colección '{collection_name}'.")
+
+    # Refrescar el cubo pre-agregado que leen las rutas del dashboard
+    if incremental:
+        actualizar_rollup(db, anios=resumen["anios"], origen=collection_name)
+    else:
+        # Índices y validación en el staging, antes de publicar
+        fusionar_claves_repetidas(staging)
+        asegurar_clave_unica(staging)
+        copiar_indices(collection, staging)
+        aplicar_indices_coleccion(staging, INDICES_DENUNCIAS)
+        validar_staging(staging, resumen)
+
+        construir_rollup(db, origen=staging.name)
+        publicar_staging(db, collection_name)
+
+    guardar_watermark(db, resumen["max_periodo"], reiniciar=not incremental)
+
+    # Índices del rollup y demás colecciones (idempotente), con la colección
+    # cargada en lugar de 'denuncias' si se usó otro nombre
+    especificacion = {n: ind for n, ind in ESPECIFICACION.items() if n != COLECCION_ORIGEN}
+    especificacion[collection_name] = INDICES_DENUNCIAS
+    aplicar_indices(db, especificacion)
+
+    # Foto Parquet del rollup con la próxima versión, escrita ANTES de
+    # publicarla: la app que vea la versión nueva ya encuentra su foto.
+    # La foto es opcional: si falla, la app lee de Mongo y la versión se publica igual
+    version = reservar_version_datos(db)
+    try:
+        escribir_snapshot(db, version)
+    except Exception as e:
+        print(f"⚠️ No se pudo escribir la foto Parquet (la app usará Mongo): {e}")
+
+    # Nueva versión de datos: la app descarta sus agregaciones cacheadas
+    incrementar_version_datos(db, version)
 
 
 # ========= MAIN =========
 
 if __name__ == "__main__":
-    try:
-        # 1. Leer y procesar el CSV
-        df = cargar_csv_en_dataframe(CSV_FILE)
+    # Uso: python etl_carga_mongo.py [completo|incremental|revertir]
+    modo = sys.argv[1] if len(sys.argv) > 1 else MODO_CARGA
 
-        # 2. Conectarse a MongoDB
+    try:
+        # 1. Conectarse a MongoDB
         client = conectar_mongo(MONGO_URI)
 
-        # 3. Cargar DataFrame a Mongo
-        cargar_dataframe_a_mongo(df, client, DB_NAME, COLLECTION_NAME)
+        if modo == "revertir":
+            revertir_carga(client, DB_NAME, COLLECTION_NAME)
+        else:
+            # 2. Leer el CSV por bloques y cargarlo a Mongo en lotes
+            bloques = leer_csv_por_bloques(CSV_FILE)
+            cargar_dataframe_a_mongo(bloques, client, DB_NAME, COLLECTION_NAME, modo=modo)
 
         print("Proceso ETL finalizado correctamente ✅")
 
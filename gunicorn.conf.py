@@ -0,0 +1,23 @@
+# gunicorn.conf.py
+# Configuración de gunicorn: se carga sola al ejecutar `gunicorn app:app`
+# desde esta carpeta.
+#
+# Workers 'gthread': cada worker atiende varias peticiones a la vez, una por
+# hilo. Con workers 'sync' una vista async (chat, agente, lote de gráficos)
+# deja su worker ocupado mientras espera a Mongo o a Gemini; con hilos, el
+# worker sigue atendiendo otras peticiones. Flask corre cada vista async en
+# un event loop propio del hilo (asgiref), así que no hay loop compartido.
+import os
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+worker_class = "gthread"
+# Pocos workers: cada uno carga pandas, sklearn, los modelos, el cubo y sus
+# propios hilos de fondo, así que la memoria crece con cada worker. La
+# concurrencia la dan los hilos.
+workers = int(os.getenv("GUNICORN_WORKERS", 1))
+# Peticiones simultáneas por worker. Conexiones a Mongo: aprox.
+# workers × MONGO_MAX_POOL (mongo_cliente.py), no workers × hilos
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+# Mayor que ASYNC_TIMEOUT_SEGUNDOS: la vista responde antes de que gunicorn corte
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
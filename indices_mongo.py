@@ -0,0 +1,139 @@
+# indices_mongo.py
+# Especificación declarativa de índices y reporte de planes (explain).
+#
+# aplicar_indices() es idempotente: crear un índice que ya existe con la
+# misma definición no hace nada, así que se llama al iniciar la app y al
+# terminar cada carga del ETL. Los nombres se dejan por defecto
+# (p. ej. "ANIO_1_MES_1") para coincidir con índices creados antes a mano.
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+# Filtros usados por mongo_queries, ml_riesgo, comparativa_foco, reporte_lima y el chat
+INDICES_DENUNCIAS = [
+    {"keys": [("P_MODALIDADES", ASCENDING), ("DPTO_HECHO_NEW", ASCENDING), ("ANIO", ASCENDING)]},
+    {"keys": [("DPTO_HECHO_NEW", ASCENDING), ("ANIO", ASCENDING)]},
+    {"keys": [("ANIO", ASCENDING), ("MES", ASCENDING)]},
+    {"keys": [("P_MODALIDADES", ASCENDING), ("trimestre", ASCENDING)]},
+    # Campos normalizados (reporte_lima y chat)
+    {"keys": [("DPTO_GRUPO", ASCENDING), ("MOD_FAMILIA", ASCENDING), ("ANIO", ASCENDING)]},
+    # Llave de fila del ETL: única (el ETL la crea antes del primer upsert)
+    {"keys": [("clave_fila", ASCENDING)], "unique": True},
+]
+
+# El rollup recibe los mismos filtros (tiene los mismos campos)
+INDICES_ROLLUP = [
+    {"keys": [("P_MODALIDADES", ASCENDING), ("DPTO_HECHO_NEW", ASCENDING), ("ANIO", ASCENDING)]},
+    {"keys": [("DPTO_HECHO_NEW", ASCENDING), ("ANIO", ASCENDING)]},
+    {"keys": [("ANIO", ASCENDING), ("MES", ASCENDING)]},
+    {"keys": [("DPTO_GRUPO", ASCENDING), ("MOD_FAMILIA", ASCENDING), ("ANIO", ASCENDING)]},
+]
+
+INDICES_USUARIOS = [
+    {"keys": [("username", ASCENDING)], "unique": True},
+    {"keys": [("last_seen", DESCENDING)]},
+]
+
+INDICES_AUDITORIA = [
+    {"keys": [("fecha", DESCENDING)]},
+]
+
+ESPECIFICACION = {
+    "denuncias": INDICES_DENUNCIAS,
+    "denuncias_rollup": INDICES_ROLLUP,
+    "usuarios": INDICES_USUARIOS,
+    "auditoria": INDICES_AUDITORIA,
+}
+
+
+def aplicar_indices_coleccion(col, indices):
+    """Crea (si faltan) los índices de una colección. Devuelve sus nombres."""
+    modelos = [IndexModel(ind["keys"], **{k: v for k, v in ind.items() if k != "keys"}) for ind in indices]
+    try:
+        return col.create_indexes(modelos)
+    except OperationFailure as e:
+        print(f"⚠️ No se pudieron crear índices en '{col.name}': {e}")
+
+    # Uno por uno: un índice en conflicto (p. ej. 'clave_fila' aún no único) no frena al resto
+    creados = []
+    for modelo in modelos:
+        try:
+            creados += col.create_indexes([modelo])
+        except OperationFailure as e:
+            print(f"⚠️ Índice {modelo.document['name']} no creado en '{col.name}': {e}")
+    return creados
+
+
+def aplicar_indices(db, especificacion=ESPECIFICACION):
+    """Aplica toda la especificación. Seguro de llamar las veces que haga falta."""
+    creados = {}
+    for nombre_col, indices in especificacion.items():
+        creados[nombre_col] = aplicar_indices_coleccion(db[nombre_col], indices)
+    print(f"✅ Índices verificados en {len(creados)} colecciones.")
+    return creados
+
+
+# ==========================================
+# REPORTE DE PLANES (EXPLAIN)
+# ==========================================
+
+def _etapas_plan(nodo, etapas, indices):
+    """Recorre el plan de explain y junta las etapas y los índices usados."""
+    if isinstance(nodo, dict):
+        if "stage" in nodo:
+            etapas.append(nodo["stage"])
+        if "indexName" in nodo:
+            indices.append(nodo["indexName"])
+        for valor in nodo.values():
+            _etapas_plan(valor, etapas, indices)
+    elif isinstance(nodo, list):
+        for valor in nodo:
+            _etapas_plan(valor, etapas, indices)
+
+
+def explicar_pipeline(col, pipeline):
+    """Plan (queryPlanner) de un pipeline de agregación."""
+    plan = col.database.command(
+        "explain",
+        {"aggregate": col.name, "pipeline": pipeline, "cursor": {}},
+        verbosity="queryPlanner"
+    )
+    etapas, indices = [], []
+    _etapas_plan(plan, etapas, indices)
+    tiene_filtro = bool(pipeline) and "$match" in pipeline[0]
+    return {
+        "coleccion": col.name,
+        "primera_etapa": next(iter(pipeline[0]), None) if pipeline else None,
+        "etapas": sorted(set(etapas)),
+        "indices": sorted(set(indices)),
+        "collscan": "COLLSCAN" in etapas,
+        # Sin $match inicial el recorrido completo es esperado (p. ej. totales sobre el rollup)
+        "sin_filtro": not tiene_filtro,
+    }
+
+
+def reporte_explain(pipelines):
+    """
+    Recibe pares (colección, pipeline) y devuelve un reporte por pipeline,
+    con los que hacen COLLSCAN teniendo filtro primero.
+    """
+    reporte = []
+    for col, pipeline in pipelines:
+        try:
+            fila = explicar_pipeline(col, pipeline)
+        except Exception as e:
+            fila = {"coleccion": col.name, "error": str(e), "collscan": None, "sin_filtro": None}
+        fila["pipeline"] = str(pipeline)
+        fila["alerta"] = bool(fila.get("collscan")) and not fila.get("sin_filtro")
+        reporte.append(fila)
+
+    reporte.sort(key=lambda f: (not f["alerta"], f["coleccion"]))
+    for fila in reporte:
+        if fila["alerta"]:
+            print(f"⚠️ COLLSCAN en '{fila['coleccion']}': {fila['pipeline'][:120]}")
+    return reporte
+
+
+if __name__ == "__main__":
+    # Aplicación manual: python indices_mongo.py
+    from ml_utils import db
+    aplicar_indices(db)
@@ -0,0 +1,137 @@
+# ml_registro.py
+# Registro de modelos de riesgo (Random Forest) ya entrenados.
+#
+# Cada modelo se identifica por (modalidad, versión de datos). Se entrena una
+# sola vez, se guarda en disco con joblib junto con su LabelEncoder y el
+# histórico usado para los gráficos, y se sirve desde memoria. Cuando el ETL
+# publica una nueva versión de datos, el modelo anterior deja de usarse.
+import os
+import re
+import threading
+import unicodedata
+import joblib
+
+from mongo_cache import leer_version_datos
+from ml_utils import entrenar_modelo_riesgo
+
+MODELOS_DIR = os.getenv("MODELOS_DIR", "modelos")
+# Objetivo con el que se entrenan los modelos: forma parte del nombre del
+# archivo para no cargar artefactos entrenados con otro objetivo.
+#   "celda" = total por (anio, trimestre, departamento); antes era 'cantidad' por registro
+OBJETIVO_MODELO = "celda"
+FORMATO_ARCHIVO = "riesgo_{slug}_{objetivo}_v{version}.joblib"
+# Nombre de los archivos de antes de OBJETIVO_MODELO (se borran al guardar)
+FORMATO_ARCHIVO_ANTERIOR = "riesgo_{slug}_v{version}.joblib"
+
+_modelos = {}          # (modalidad, version) -> (modelo, df_hist, le_dpto)
+_locks = {}            # un lock por llave para no entrenar dos veces lo mismo
+_lock_global = threading.Lock()
+
+
+def _slug(texto):
+    texto = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]+", "_", texto.lower()).strip("_")
+
+
+def _ruta_modelo(modalidad, version):
+    nombre = FORMATO_ARCHIVO.format(slug=_slug(modalidad), objetivo=OBJETIVO_MODELO, version=version)
+    return os.path.join(MODELOS_DIR, nombre)
+
+
+def _patron_versiones(modalidad, formato):
+    """Regex de los archivos de cualquier versión de la modalidad con ese formato."""
+    antes, despues = formato.split("{version}")
+    antes = antes.format(slug=_slug(modalidad), objetivo=OBJETIVO_MODELO)
+    return re.compile(re.escape(antes) + r"\d+" + re.escape(despues) + "$")
+
+
+def _guardar(modalidad, version, artefacto):
+    os.makedirs(MODELOS_DIR, exist_ok=True)
+    ruta = _ruta_modelo(modalidad, version)
+    joblib.dump(artefacto, ruta, compress=3)
+
+    # Borramos los archivos de versiones anteriores de esta modalidad (y los
+    # que quedaron con el nombre de antes de OBJETIVO_MODELO)
+    patrones = [_patron_versiones(modalidad, f) for f in (FORMATO_ARCHIVO, FORMATO_ARCHIVO_ANTERIOR)]
+    for nombre in os.listdir(MODELOS_DIR):
+        if any(p.match(nombre) for p in patrones) and os.path.join(MODELOS_DIR, nombre) != ruta:
+            try:
+                os.remove(os.path.join(MODELOS_DIR, nombre))
+            except OSError:
+                pass
+
+
+def _cargar(modalidad, version):
+    ruta = _ruta_modelo(modalidad, version)
+    if not os.path.exists(ruta):
+        return None
+    try:
+        artefacto = joblib.load(ruta)
+        print(f"📦 Modelo de riesgo '{modalidad}' v{version} cargado desde disco.")
+        return artefacto["modelo"], artefacto["df_hist"], artefacto["le_dpto"]
+    except Exception as e:
+        print(f"⚠️ No se pudo leer {ruta}, se reentrenará: {e}")
+        return None
+
+
+def obtener_modelo_riesgo(col, modalidad="Extorsión"):
+    """
+    Devuelve (modelo, df_hist, le_dpto) igual que entrenar_modelo_riesgo,
+    pero entrenando solo si no existe en memoria ni en disco para la
+    versión de datos actual.
+    """
+    version = leer_version_datos(col.database)
+    llave = (modalidad, version)
+
+    resultado = _modelos.get(llave)
+    if resultado is not None:
+        return resultado
+
+    with _lock_global:
+        lock = _locks.setdefault(llave, threading.Lock())
+
+    with lock:
+        # Otro hilo pudo terminar mientras esperábamos
+        resultado = _modelos.get(llave)
+        if resultado is not None:
+            return resultado
+
+        resultado = _cargar(modalidad, version)
+        if resultado is None:
+            print(f"🧠 Entrenando modelo de riesgo '{modalidad}' v{version}...")
+            resultado = entrenar_modelo_riesgo(col, modalidad)
+            modelo, df_hist, le_dpto = resultado
+            if modelo is not None:
+                try:
+                    _guardar(modalidad, version, {"modelo": modelo, "df_hist": df_hist, "le_dpto": le_dpto})
+                except Exception as e:
+                    print(f"⚠️ No se pudo guardar el modelo en disco: {e}")
+
+        if resultado[0] is None:
+            # Sin datos: no se guarda (cada modalidad inexistente ocuparía memoria)
+            with _lock_global:
+                _locks.pop(llave, None)
+            return resultado
+
+        # Liberamos los modelos de versiones anteriores de esta modalidad
+        with _lock_global:
+            for vieja in [k for k in _locks if k[0] == modalidad and k != llave]:
+                _modelos.pop(vieja, None)
+                _locks.pop(vieja, None)
+        _modelos[llave] = resultado
+
+    return resultado
+
+
+def precargar_modelos(col, modalidades=("Extorsión",)):
+    """Carga (o entrena) los modelos en segundo plano al iniciar la app."""
+    def _tarea():
+        for modalidad in modalidades:
+            try:
+                obtener_modelo_riesgo(col, modalidad)
+            except Exception as e:
+                print(f"⚠️ Error precargando modelo '{modalidad}': {e}")
+
+    hilo = threading.Thread(target=_tarea, name="precarga-modelos", daemon=True)
+    hilo.start()
+    return hilo
@@ -3,69 +3,105 @@ import numpy as np
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import LabelEncoder
 
-def preparar_dataset_riesgo(col, modalidad_objetivo):
-    """
-    Prepara los datos para el modelo, sumando la columna 'cantidad'.
-    """
-    match_filter = {
-        "$or": [
-            {"P_MODALIDADES": modalidad_objetivo},
-            {"modalidad": modalidad_objetivo}
-        ]
-    }
-
-    # Pipeline: Agrupar por Trimestre y Sumar Cantidad Real
-    pipeline = [
+TRIM_MAP = {"T1": 1, "T2": 2, "T3": 3, "T4": 4}
+
+# Tamaño de lote del cursor y capacidad inicial de los arreglos
+# (26 departamentos × 4 trimestres × 12 años); crecen si hace falta.
+LOTE_CURSOR = 1000
+CAPACIDAD_INICIAL = 26 * 4 * 12
+
+
+def _pipeline_riesgo(match_filter, campo_anio, campo_dpto):
+    """Agrega en Mongo por (anio, trimestre, dpto) y devuelve filas planas."""
+    return [
         { "$match": match_filter },
         {
             "$group": {
-                "_id": { 
-                    "anio": "$ANIO", 
+                "_id": {
+                    "anio": f"${campo_anio}",
                     "trimestre": "$trimestre",
-                    "dpto": "$DPTO_HECHO_NEW" 
+                    "dpto": f"${campo_dpto}"
                 },
-                "total": { "$sum": "$cantidad" } 
+                "total": { "$sum": "$cantidad" }
             }
-        }
+        },
+        # Solo viajan por la red los 4 campos que usa el modelo
+        { "$project": { "_id": 0, "anio": "$_id.anio", "trimestre": "$_id.trimestre", "dpto": "$_id.dpto", "total": 1 } }
     ]
 
-    resultados = list(col.aggregate(pipeline))
-    
-    # Fallback minúsculas
-    if not resultados:
-        pipeline[1]["$group"]["_id"] = { "anio": "$anio", "trimestre": "$trimestre", "dpto": "$departamento" }
-        pipeline[1]["$group"]["total"] = { "$sum": "$cantidad" }
-        resultados = list(col.aggregate(pipeline))
 
-    datos = []
-    trim_map = {"T1": 1, "T2": 2, "T3": 3, "T4": 4}
+def _leer_en_arreglos(cursor):
+    """
+    Consume el cursor por lotes y llena arreglos NumPy preasignados,
+    descartando filas incoherentes. Devuelve un DataFrame ya tipado.
+    """
+    capacidad = CAPACIDAD_INICIAL
+    anios = np.zeros(capacidad, dtype=np.int32)
+    trims = np.zeros(capacidad, dtype=np.int8)
+    dptos = np.empty(capacidad, dtype=object)
+    totales = np.zeros(capacidad, dtype=np.int64)
+    n = 0
 
-    for d in resultados:
-        id_doc = d.get("_id", {})
+    for d in cursor:
         try:
-            val_anio = int(id_doc.get("anio") or 0)
-            val_trim = id_doc.get("trimestre")
-            val_dpto = str(id_doc.get("dpto") or "DESCONOCIDO").upper().strip()
-            val_total = d.get("total", 0)
-            
-            if val_anio > 2000 and val_trim in trim_map:
-                datos.append({
-                    "anio": val_anio,
-                    "trimestre": val_trim,
-                    "trimestre_num": trim_map[val_trim],
-                    "departamento": val_dpto,
-                    "total": val_total
-                })
-        except: continue
-
-    if not datos: return pd.DataFrame()
-
-    df = pd.DataFrame(datos)
+            val_anio = int(d.get("anio") or 0)
+            val_trim = TRIM_MAP.get(d.get("trimestre"))
+            if val_anio <= 2000 or val_trim is None:
+                continue
+            if n == capacidad:
+                capacidad *= 2
+                anios = np.resize(anios, capacidad)
+                trims = np.resize(trims, capacidad)
+                dptos = np.resize(dptos, capacidad)
+                totales = np.resize(totales, capacidad)
+            anios[n] = val_anio
+            trims[n] = val_trim
+            dptos[n] = str(d.get("dpto") or "DESCONOCIDO").upper().strip()
+            totales[n] = d.get("total", 0) or 0
+            n += 1
+        except (TypeError, ValueError):
+            continue
+
+    if n == 0:
+        return pd.DataFrame()
+
+    trimestre = np.char.add("T", trims[:n].astype(str))
+    df = pd.DataFrame({
+        "anio": anios[:n],
+        "trimestre": trimestre,
+        "trimestre_num": trims[:n],
+        "departamento": dptos[:n],
+        "total": totales[:n]
+    })
+    return df
+
+
+def preparar_dataset_riesgo(col, modalidad_objetivo):
+    """
+    Dataset de entrenamiento del modelo de riesgo, agregado en el servidor:
+    una fila por (anio, trimestre, departamento) con la suma de 'cantidad'.
+    """
+    pipeline = _pipeline_riesgo({"P_MODALIDADES": modalidad_objetivo}, "ANIO", "DPTO_HECHO_NEW")
+    df = _leer_en_arreglos(col.aggregate(pipeline, batchSize=LOTE_CURSOR, allowDiskUse=True))
+
+    # Fallback: esquema con nombres en minúscula
+    if df.empty:
+        match_filter = {
+            "$or": [
+                {"P_MODALIDADES": modalidad_objetivo},
+                {"modalidad": modalidad_objetivo}
+            ]
+        }
+        pipeline = _pipeline_riesgo(match_filter, "anio", "departamento")
+        df = _leer_en_arreglos(col.aggregate(pipeline, batchSize=LOTE_CURSOR, allowDiskUse=True))
+
+    if df.empty: return df
+
     df['periodo'] = df['anio'].astype(str) + "-" + df['trimestre']
-    df = df.sort_values(by=['anio', 'trimestre_num'])
+    df = df.sort_values(by=['anio', 'trimestre_num']).reset_index(drop=True)
     return df
 
-def entrenar_modelo_riesgo(col, modalidad_objetivo):
+def entrenar_modelo_riesgo(col, modalidad_objetivo, n_estimators=100):
     """ Entrena el modelo Random Forest """
     df = preparar_dataset_riesgo(col, modalidad_objetivo)
     
@@ -77,7 +113,7 @@ def entrenar_modelo_riesgo(col, modalidad_objetivo):
     X = df[['anio', 'trimestre_num', 'dpto_code']]
     y = df['total']
     
-    modelo = RandomForestRegressor(n_estimators=100, random_state=42)
+    modelo = RandomForestRegressor(n_estimators=n_estimators, random_state=42)
     modelo.fit(X, y)
     
     return modelo, df, le_dpto
@@ -89,8 +125,7 @@ def predecir_valor_especifico(modelo, le_dpto, anio, trimestre_str, departamento
     """
     try:
         anio = int(anio)
-        trim_map = {"T1": 1, "T2": 2, "T3": 3, "T4": 4}
-        trim_num = trim_map.get(trimestre_str, 1)
+        trim_num = TRIM_MAP.get(trimestre_str, 1)
         departamento = str(departamento).upper().strip()
         
         # Verificar si el departamento es conocido por el modelo
@@ -1,22 +1,18 @@
-import os
 import pandas as pd
 import numpy as np
 from sklearn.linear_model import LinearRegression
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.preprocessing import LabelEncoder
-from pymongo import MongoClient
-from dotenv import load_dotenv
+from mongo_cliente import obtener_cliente, DB_NAME
+from mongo_cache import agregar
+import ml_riesgo
 
 # ==========================================
 # 1. CONFIGURACIÓN DE BASE DE DATOS (CRUCIAL)
 # ==========================================
-load_dotenv()
-MONGO_URI = os.getenv("MONGO_URI")
-
 try:
-    client = MongoClient(MONGO_URI)
-    # Asegúrate que este sea el nombre real de tu BD en Atlas
-    db = client['denuncias_db'] 
+    # Cliente compartido (pool configurado en mongo_cliente.py)
+    client = obtener_cliente()
+    # Asegúrate que este sea el nombre real de tu BD en Atlas (MONGO_DB)
+    db = client[DB_NAME]
     print("✅ Conexión a MongoDB exitosa en ml_utils")
 except Exception as e:
     print(f"❌ Error conectando a MongoDB: {e}")
@@ -51,13 +47,13 @@ def preparar_mensual(col, modalidad=None):
         { "$sort": { "_id.anio": 1, "_id.mes": 1 } }
     ]
 
-    resultados = list(col.aggregate(pipeline))
+    resultados = agregar(col, pipeline)
     
     # Fallback: Si no trajo nada, probamos agrupar por minúsculas
     if not resultados:
         pipeline[1]["$group"]["_id"] = { "anio": "$anio", "mes": "$mes" }
         pipeline[1]["$group"]["total"] = { "$sum": "$cantidad" }
-        resultados = list(col.aggregate(pipeline))
+        resultados = agregar(col, pipeline)
 
     # 3. Limpieza y estructuración
     datos = []
@@ -79,11 +75,13 @@ def preparar_mensual(col, modalidad=None):
 
     return pd.DataFrame(datos)
 
-def predecir_total_2026(col):
+def predecir_total_2026(col, df=None):
     """
     Retorna 5 valores: total, etiquetas, predicciones, historico_valores, historico_anios
+    Si ya se tiene la serie mensual (preparar_mensual), se puede pasar en 'df'.
     """
-    df = preparar_mensual(col)
+    if df is None:
+        df = preparar_mensual(col)
     
     if df.empty or len(df) < 12:
         return 0, [], [], [], []
@@ -109,18 +107,20 @@ def predecir_total_2026(col):
     
     return total_2026, meses_txt, predicciones.tolist(), df['total'].tail(12).tolist(), df['anio'].tail(12).tolist()
 
+def formatear_contexto_historico(historico_val, historico_anio):
+    texto_contexto = ""
+    limit = min(3, len(historico_val))
+    for i in range(1, limit + 1):
+        texto_contexto += f"[{historico_anio[-i]}: {int(historico_val[-i])} casos] "
+    return texto_contexto
+
 def obtener_contexto_ia(col):
     total_2026, _, _, historico_val, historico_anio = predecir_total_2026(col)
     
     if total_2026 == 0:
         return 0, "Datos insuficientes"
     
-    texto_contexto = ""
-    limit = min(3, len(historico_val))
-    for i in range(1, limit + 1):
-        texto_contexto += f"[{historico_anio[-i]}: {int(historico_val[-i])} casos] "
-            
-    return total_2026, texto_contexto
+    return total_2026, formatear_contexto_historico(historico_val, historico_anio)
 
 # ==========================================
 # 3. FUNCIONES DEL SIMULADOR DE RIESGO (FALTABAN ESTAS)
@@ -128,48 +128,17 @@ def obtener_contexto_ia(col):
 
 def entrenar_modelo_riesgo(col, modalidad_objetivo="Extorsión"):
     """
-    Prepara el modelo Random Forest para el Agente Logístico
+    Prepara el modelo Random Forest para el Agente Logístico.
+    El dataset se agrega en Mongo (ver ml_riesgo.preparar_dataset_riesgo):
+    una fila por (anio, trimestre, departamento) en lugar de cada registro.
+
+    OJO: el objetivo es el TOTAL de denuncias del departamento en el
+    trimestre (suma de 'cantidad'), no la 'cantidad' de un registro suelto
+    como antes, así que las predicciones del simulador están en esa escala.
+    Los modelos guardados con el objetivo anterior no se reutilizan
+    (ver ml_registro.OBJETIVO_MODELO).
     """
-    data = list(col.find(
-        {"P_MODALIDADES": modalidad_objetivo},
-        {"ANIO": 1, "trimestre": 1, "DPTO_HECHO_NEW": 1, "cantidad": 1, "_id": 0}
-    ))
-    
-    if not data:
-        return None, pd.DataFrame(), None
-
-    df = pd.DataFrame(data)
-    
-    # Normalización de nombres (por si acaso vienen distintos)
-    df.rename(columns={
-        "ANIO": "anio", 
-        "DPTO_HECHO_NEW": "departamento", 
-        "cantidad": "total"
-    }, inplace=True)
-
-    # Limpieza básica
-    df = df.dropna()
-    df['anio'] = pd.to_numeric(df['anio'], errors='coerce').fillna(0).astype(int)
-    
-    # Mapeo de Trimestres
-    trim_map = {"T1": 1, "T2": 2, "T3": 3, "T4": 4}
-    df['trimestre_num'] = df['trimestre'].map(trim_map).fillna(1).astype(int)
-
-    # Codificación de Departamentos
-    le_dpto = LabelEncoder()
-    df['dpto_code'] = le_dpto.fit_transform(df['departamento'].astype(str))
-
-    # Entrenar Random Forest
-    X = df[['anio', 'trimestre_num', 'dpto_code']]
-    y = df['total']
-    
-    rf_model = RandomForestRegressor(n_estimators=50, random_state=42)
-    rf_model.fit(X, y)
-    
-    # Agregamos una columna 'periodo' para gráficos
-    df['periodo'] = df['anio'].astype(str) + "-" + df['trimestre']
-    
-    return rf_model, df, le_dpto
+    return ml_riesgo.entrenar_modelo_riesgo(col, modalidad_objetivo, n_estimators=50)
 
 def predecir_valor_especifico(modelo, le_dpto, anio, trimestre_str, departamento):
     """
@@ -192,4 +161,47 @@ def predecir_valor_especifico(modelo, le_dpto, anio, trimestre_str, departamento
         return int(max(prediccion[0], 0))
     except Exception as e:
         print(f"Error predicción específica: {e}")
-        return 0
\ No newline at end of file
+        return 0
+
+def predecir_lote(modelo, le_dpto, anios, trimestres, departamentos):
+    """
+    Predice la grilla completa anios × trimestres × departamentos con una
+    sola llamada a model.predict. Los departamentos que el modelo no conoce
+    se omiten y se devuelven aparte.
+    Retorna (filas, desconocidos), con filas = [{anio, trimestre, departamento, prediccion}].
+    """
+    if not modelo: return [], list(departamentos)
+
+    trim_map = ml_riesgo.TRIM_MAP
+    trimestres = [str(t).upper().strip() for t in trimestres]
+    trimestres = [t for t in dict.fromkeys(trimestres) if t in trim_map]
+    # Misma normalización que la predicción puntual (predecir_valor_especifico)
+    departamentos = list(dict.fromkeys(str(d).upper().strip() for d in departamentos))
+    conocidos = set(le_dpto.classes_)
+    validos = [d for d in departamentos if d in conocidos]
+    desconocidos = [d for d in departamentos if d not in conocidos]
+
+    if not (anios and trimestres and validos):
+        return [], desconocidos
+
+    # Grilla vectorizada: cada eje se combina con meshgrid en orden (anio, trimestre, dpto)
+    codigos = le_dpto.transform(validos)
+    g_anio, g_trim, g_dpto = np.meshgrid(
+        np.array(anios, dtype=int),
+        np.array([trim_map[t] for t in trimestres], dtype=int),
+        np.arange(len(validos)),
+        indexing="ij"
+    )
+    X = pd.DataFrame({
+        "anio": g_anio.ravel(),
+        "trimestre_num": g_trim.ravel(),
+        "dpto_code": codigos[g_dpto.ravel()]
+    })
+    predicciones = np.maximum(modelo.predict(X), 0).astype(int)
+
+    nombres_trim = {v: k for k, v in trim_map.items()}
+    filas = [
+        {"anio": int(a), "trimestre": nombres_trim[int(t)], "departamento": validos[int(i)], "prediccion": int(p)}
+        for a, t, i, p in zip(g_anio.ravel(), g_trim.ravel(), g_dpto.ravel(), predicciones)
+    ]
+    return filas, desconocidos
@@ -0,0 +1,72 @@
+# mongo_async.py
+# Acceso a datos para las vistas async de Flask.
+#
+# Flask ejecuta cada vista async en un event loop propio de la petición
+# (asgiref), así que un cliente Motor —que queda atado a un loop— no se puede
+# compartir entre peticiones. En su lugar, las llamadas bloqueantes (pymongo,
+# Gemini) se mandan a un pool de hilos compartido y usan el pool de
+# conexiones del cliente único (mongo_cliente.py); asyncio.gather las
+# mantiene en vuelo a la vez dentro de la petición. Entre peticiones, la
+# concurrencia la dan los workers 'gthread' de gunicorn (gunicorn.conf.py).
+import os
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from mongo_cache import agregar
+
+# Hilos para E/S bloqueante: acota cuántas consultas/llamadas quedan en vuelo por proceso
+MAX_HILOS_ASYNC = int(os.getenv("ASYNC_MAX_HILOS", 16))
+TIMEOUT_ASYNC = float(os.getenv("ASYNC_TIMEOUT_SEGUNDOS", 15))
+
+# Pool aparte y más chico para los lotes de gráficos: si un lote se pasa del
+# timeout, lo que sigue corriendo no le quita hilos al chat
+MAX_HILOS_LOTE = int(os.getenv("ASYNC_MAX_HILOS_LOTE", 4))
+
+_pool = ThreadPoolExecutor(max_workers=MAX_HILOS_ASYNC, thread_name_prefix="async-io")
+_pool_lote = ThreadPoolExecutor(max_workers=MAX_HILOS_LOTE, thread_name_prefix="async-lote")
+
+
+async def _en_pool(pool, funcion, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    contexto = contextvars.copy_context()
+    llamada = functools.partial(contexto.run, funcion, *args, **kwargs)
+    return await loop.run_in_executor(pool, llamada)
+
+
+async def en_hilo(funcion, *args, **kwargs):
+    """Ejecuta una función bloqueante en el pool compartido (como asyncio.to_thread)."""
+    return await _en_pool(_pool, funcion, *args, **kwargs)
+
+
+async def agregar_async(col, pipeline, **kwargs):
+    """Equivalente async de mongo_cache.agregar (usa la misma caché)."""
+    return await en_hilo(agregar, col, pipeline, **kwargs)
+
+
+async def reunir(*corutinas, timeout=TIMEOUT_ASYNC):
+    """asyncio.gather con un tiempo máximo para el conjunto."""
+    return await asyncio.wait_for(asyncio.gather(*corutinas), timeout=timeout)
+
+
+async def reunir_lote(funciones, timeout=TIMEOUT_ASYNC):
+    """
+    Ejecuta {nombre: función} en el pool de lotes (a lo más MAX_HILOS_LOTE a
+    la vez) y espera hasta 'timeout'. Devuelve (resultados, pendientes): lo
+    que no terminó se cancela si aún estaba en cola; lo que ya corría termina
+    en su hilo sin ocupar el pool general.
+    """
+    tareas = {nombre: asyncio.ensure_future(_en_pool(_pool_lote, f)) for nombre, f in funciones.items()}
+    hechas = set()
+    if tareas:
+        hechas, _ = await asyncio.wait(tareas.values(), timeout=timeout)
+
+    resultados, pendientes = {}, []
+    for nombre, tarea in tareas.items():
+        if tarea in hechas:
+            resultados[nombre] = tarea.result()
+        else:
+            tarea.cancel()
+            pendientes.append(nombre)
+    return resultados, pendientes
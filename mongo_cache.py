@@ -0,0 +1,216 @@
+# mongo_cache.py
+# Caché en memoria (TTL + LRU) para los resultados de col.aggregate(...).
+#
+# Los datos solo cambian cuando corre el ETL, así que cada resultado se
+# guarda bajo una llave que incluye la "versión de datos". El ETL incrementa
+# esa versión en la colección 'estadisticas' al terminar una carga; cuando la
+# app detecta el cambio, descarta todo lo cacheado.
+import os
+import copy
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from cachetools import TTLCache
+from pymongo import ReadPreference, ReturnDocument
+from pymongo.read_concern import ReadConcern
+
+CACHE_TTL = int(os.getenv("CACHE_TTL_SEGUNDOS", 600))
+CACHE_MAX_ENTRADAS = int(os.getenv("CACHE_MAX_ENTRADAS", 256))
+# Cada cuántos segundos se vuelve a leer la versión de datos desde Mongo
+VERSION_TTL = int(os.getenv("CACHE_VERSION_TTL_SEGUNDOS", 30))
+
+COLECCION_ESTADISTICAS = "estadisticas"
+ID_VERSION = "version_datos"
+
+MAYORIA = ReadConcern("majority")
+
+# TTLCache desaloja por antigüedad (TTL) y, si se llena, por uso (LRU)
+_cache = TTLCache(maxsize=CACHE_MAX_ENTRADAS, ttl=CACHE_TTL)
+_lock = threading.Lock()
+_contadores = {"hits": 0, "misses": 0, "invalidaciones": 0}
+_version = {"valor": None, "actualizado": None, "leida_en": 0.0}
+
+# Pipelines distintos que pasaron por agregar(): sirven para el reporte de
+# explain (indices_mongo.reporte_explain) sin duplicar los pipelines de las rutas.
+MAX_PIPELINES_REGISTRADOS = 200
+_pipelines = OrderedDict()
+
+
+# ==========================================
+# VERSIÓN DE DATOS
+# ==========================================
+
+def leer_version_datos(db, forzar=False):
+    """
+    Devuelve la versión de datos vigente. Se relee de Mongo como máximo
+    cada VERSION_TTL segundos; si cambió, se vacía la caché.
+    """
+    ahora = time.monotonic()
+    if not forzar and _version["valor"] is not None and ahora - _version["leida_en"] < VERSION_TTL:
+        return _version["valor"]
+
+    try:
+        # Siempre del primario: 'db' puede ser la base analítica (secondaryPreferred).
+        # 'majority': la versión que usan las llaves nunca es más nueva que lo
+        # que una lectura causal (sesion_causal) alcanza a ver
+        estadisticas = db.get_collection(COLECCION_ESTADISTICAS, read_preference=ReadPreference.PRIMARY,
+                                         read_concern=MAYORIA)
+        doc = estadisticas.find_one({"_id": ID_VERSION}) or {}
+        version = doc.get("version", 0)
+        actualizado = doc.get("actualizado")
+    except Exception as e:
+        print(f"⚠️ No se pudo leer la versión de datos: {e}")
+        version = _version["valor"] or 0
+        actualizado = _version["actualizado"]
+
+    with _lock:
+        if _version["valor"] is not None and version != _version["valor"]:
+            _cache.clear()
+            _contadores["invalidaciones"] += 1
+            print(f"♻️ Versión de datos {_version['valor']} -> {version}: caché vaciada.")
+        _version["valor"] = version
+        _version["actualizado"] = actualizado
+        _version["leida_en"] = ahora
+    return version
+
+
+def leer_marca_datos(db):
+    """(versión, fecha de actualización) vigentes, con la misma relectura cada VERSION_TTL."""
+    version = leer_version_datos(db)
+    return version, _version["actualizado"]
+
+
+def lee_de_secundario(col):
+    """True si 'col' puede leer de un secundario (p. ej. la base analítica)."""
+    return col.read_preference.mode != ReadPreference.PRIMARY.mode
+
+
+@contextmanager
+def sesion_causal(db):
+    """
+    Sesión con consistencia causal para leer de un secundario sin ver datos
+    anteriores a la versión vigente. Primero lee la versión en el primario
+    (readConcern majority) dentro de la sesión; las lecturas 'majority' que
+    siguen en la misma sesión esperan a que el secundario llegue a ese
+    punto. Entrega (sesión, versión leída).
+    """
+    with db.client.start_session(causal_consistency=True) as sesion:
+        estadisticas = db.get_collection(COLECCION_ESTADISTICAS, read_preference=ReadPreference.PRIMARY,
+                                         read_concern=MAYORIA)
+        doc = estadisticas.find_one({"_id": ID_VERSION}, session=sesion) or {}
+        yield sesion, doc.get("version", 0)
+
+
+def reservar_version_datos(db):
+    """
+    Reserva el número de la próxima versión sin publicarla: la app sigue
+    viendo la vigente. El ETL lo usa para marcar la foto Parquet antes de
+    publicar la versión con incrementar_version_datos(db, reservada).
+    """
+    anterior = {"$max": [{"$ifNull": ["$version", 0]}, {"$ifNull": ["$reservada", 0]}]}
+    doc = db[COLECCION_ESTADISTICAS].find_one_and_update(
+        {"_id": ID_VERSION},
+        [{"$set": {"reservada": {"$add": [anterior, 1]}}}],
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return doc["reservada"]
+
+
+def incrementar_version_datos(db, version=None):
+    """
+    Marca una nueva versión de datos. La llama el ETL tras cada carga;
+    con 'version' publica la que se reservó antes (reservar_version_datos).
+    """
+    if version is None:
+        cambio = {"$inc": {"version": 1}}
+    else:
+        cambio = {"$max": {"version": int(version)}}
+    doc = db[COLECCION_ESTADISTICAS].find_one_and_update(
+        {"_id": ID_VERSION},
+        {**cambio, "$set": {"actualizado": datetime.now()}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    version = doc.get("version", 0)
+    print(f"🔖 Versión de datos actualizada a {version}.")
+    return version
+
+
+# ==========================================
+# CACHÉ DE AGREGACIONES
+# ==========================================
+
+def clave_pipeline(col, pipeline):
+    """
+    Hash canónico del pipeline. No se ordenan las llaves: en Mongo el orden
+    importa (p. ej. en $sort), y los pipelines del proyecto son literales.
+    """
+    texto = json.dumps(pipeline, default=str, ensure_ascii=False)
+    digest = hashlib.sha1(texto.encode("utf-8")).hexdigest()
+    return (col.full_name, digest)
+
+
+def agregar(col, pipeline, **kwargs):
+    """
+    Equivalente cacheado de list(col.aggregate(pipeline)).
+    Los documentos devueltos se comparten entre peticiones: no modificarlos.
+    """
+    version = leer_version_datos(col.database)
+    clave_base = clave_pipeline(col, pipeline)
+    clave = clave_base + (version,)
+
+    with _lock:
+        if clave_base not in _pipelines:
+            # Copia: el llamador puede reutilizar y modificar su lista después
+            _pipelines[clave_base] = (col, copy.deepcopy(pipeline))
+            if len(_pipelines) > MAX_PIPELINES_REGISTRADOS:
+                _pipelines.popitem(last=False)
+        resultado = _cache.get(clave)
+        if resultado is not None:
+            _contadores["hits"] += 1
+            return list(resultado)
+        _contadores["misses"] += 1
+
+    if lee_de_secundario(col):
+        # Un secundario atrasado devolvería datos viejos bajo la versión nueva:
+        # se lee en sesión causal y se guarda con la versión que ya refleja
+        with sesion_causal(col.database) as (sesion, version_leida):
+            resultado = list(col.with_options(read_concern=MAYORIA).aggregate(pipeline, session=sesion, **kwargs))
+        clave = clave_base + (version_leida,)
+    else:
+        resultado = list(col.aggregate(pipeline, **kwargs))
+
+    with _lock:
+        _cache[clave] = resultado
+    return list(resultado)
+
+
+def pipelines_registrados():
+    """Pares (colección, pipeline) ejecutados por la app desde que inició."""
+    with _lock:
+        return list(_pipelines.values())
+
+
+def limpiar_cache():
+    with _lock:
+        _cache.clear()
+        _contadores["invalidaciones"] += 1
+
+
+def estadisticas_cache():
+    """Contadores de uso para monitoreo."""
+    with _lock:
+        consultas = _contadores["hits"] + _contadores["misses"]
+        return {
+            **_contadores,
+            "ratio_hits": round(_contadores["hits"] / consultas, 3) if consultas else 0.0,
+            "entradas": len(_cache),
+            "max_entradas": _cache.maxsize,
+            "ttl": _cache.ttl,
+            "version_datos": _version["valor"]
+        }
@@ -0,0 +1,152 @@
+# mongo_cliente.py
+# Fábrica ÚNICA de clientes de MongoDB.
+#
+# Un MongoClient ya es un pool de conexiones seguro entre hilos, así que cada
+# proceso debe tener uno solo por URI: ml_utils, app.py, el ETL y los scripts
+# lo piden aquí. El tamaño del pool, los timeouts y la compresión se
+# configuran por variables de entorno (ver abajo); las lecturas analíticas
+# (rollup, reportes) pueden ir a secundarios con obtener_db_analitica(db).
+import os
+import threading
+import importlib.util
+from pymongo import MongoClient, ReadPreference, monitoring
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+DB_NAME = os.getenv("MONGO_DB", "denuncias_db")
+
+# Pool: con gunicorn cada worker tiene su cliente, así que el total de
+# conexiones es aprox. workers × MONGO_MAX_POOL
+MAX_POOL = int(os.getenv("MONGO_MAX_POOL", 50))
+MIN_POOL = int(os.getenv("MONGO_MIN_POOL", 0))
+MAX_CONEXIONES_NUEVAS = int(os.getenv("MONGO_MAX_CONECTANDO", 2))  # evita "tormentas" al arrancar
+MAX_IDLE_MS = int(os.getenv("MONGO_MAX_IDLE_MS", 60_000))
+
+# Timeouts (ms)
+TIMEOUT_SELECCION_MS = int(os.getenv("MONGO_TIMEOUT_SELECCION_MS", 5_000))
+TIMEOUT_CONEXION_MS = int(os.getenv("MONGO_TIMEOUT_CONEXION_MS", 10_000))
+# 0 = sin límite (el ETL hace $out/$merge largos); en la app conviene fijarlo
+TIMEOUT_SOCKET_MS = int(os.getenv("MONGO_TIMEOUT_SOCKET_MS", 0))
+TIMEOUT_COLA_MS = int(os.getenv("MONGO_TIMEOUT_COLA_MS", 10_000))
+
+# Compresión de red, en orden de preferencia. zstd y snappy necesitan los
+# paquetes 'zstandard' y 'python-snappy'; zlib viene con Python.
+COMPRESORES = [c.strip() for c in os.getenv("MONGO_COMPRESORES", "zstd,snappy,zlib").split(",") if c.strip()]
+_MODULO_COMPRESOR = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+_clientes = {}
+_lock = threading.Lock()
+
+
+# ==========================================
+# MÉTRICAS DEL POOL
+# ==========================================
+
+class MetricasPool(monitoring.ConnectionPoolListener):
+    """Contadores de eventos del pool de conexiones (todos los clientes del proceso)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.contadores = {
+            "conexiones_creadas": 0,
+            "conexiones_cerradas": 0,
+            "checkouts": 0,
+            "checkouts_fallidos": 0,
+            "checkins": 0,
+            "pools_limpiados": 0,
+        }
+
+    def _sumar(self, campo):
+        with self._lock:
+            self.contadores[campo] += 1
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_check_out_started(self, event): pass
+
+    def pool_cleared(self, event): self._sumar("pools_limpiados")
+    def connection_created(self, event): self._sumar("conexiones_creadas")
+    def connection_closed(self, event): self._sumar("conexiones_cerradas")
+    def connection_checked_out(self, event): self._sumar("checkouts")
+    def connection_check_out_failed(self, event): self._sumar("checkouts_fallidos")
+    def connection_checked_in(self, event): self._sumar("checkins")
+
+    def resumen(self):
+        with self._lock:
+            c = dict(self.contadores)
+        c["conexiones_abiertas"] = c["conexiones_creadas"] - c["conexiones_cerradas"]
+        c["conexiones_en_uso"] = c["checkouts"] - c["checkins"]
+        return c
+
+
+_metricas = MetricasPool()
+
+
+# ==========================================
+# FÁBRICA
+# ==========================================
+
+def compresores_disponibles(preferidos=COMPRESORES):
+    """Los compresores pedidos cuyo paquete está instalado (zlib siempre)."""
+    return [c for c in preferidos
+            if c in _MODULO_COMPRESOR and importlib.util.find_spec(_MODULO_COMPRESOR[c]) is not None]
+
+
+def opciones_cliente():
+    return {
+        "maxPoolSize": MAX_POOL,
+        "minPoolSize": MIN_POOL,
+        "maxConnecting": MAX_CONEXIONES_NUEVAS,
+        "maxIdleTimeMS": MAX_IDLE_MS,
+        "serverSelectionTimeoutMS": TIMEOUT_SELECCION_MS,
+        "connectTimeoutMS": TIMEOUT_CONEXION_MS,
+        "socketTimeoutMS": TIMEOUT_SOCKET_MS or None,
+        "waitQueueTimeoutMS": TIMEOUT_COLA_MS,
+        "compressors": compresores_disponibles(),
+        "retryWrites": True,
+        "retryReads": True,
+        "appname": "sidpol-backend",
+    }
+
+
+def obtener_cliente(uri=None):
+    """MongoClient compartido para la URI (uno por proceso)."""
+    uri = uri or MONGO_URI
+    cliente = _clientes.get(uri)
+    if cliente is not None:
+        return cliente
+
+    with _lock:
+        if uri not in _clientes:
+            opciones = opciones_cliente()
+            _clientes[uri] = MongoClient(uri, event_listeners=[_metricas], **opciones)
+            print(f"🔌 Cliente MongoDB creado (pool {MIN_POOL}-{MAX_POOL}, compresión: {opciones['compressors'] or 'ninguna'}).")
+        return _clientes[uri]
+
+
+def obtener_db(nombre=DB_NAME, uri=None):
+    """Base de datos con lectura en el primario (escrituras y lecturas que deben ser frescas)."""
+    return obtener_cliente(uri)[nombre]
+
+
+def obtener_db_analitica(db):
+    """
+    La misma base de datos que 'db' (mismo cliente y pool), pero leyendo de
+    un secundario si hay (secondaryPreferred). Para el rollup y los
+    reportes: mongo_cache.agregar lee de ella en una sesión causal, así que
+    un secundario atrasado no devuelve datos anteriores a la versión vigente.
+    """
+    return db.client.get_database(db.name, read_preference=ReadPreference.SECONDARY_PREFERRED)
+
+
+def metricas_pool():
+    """Eventos del pool y configuración vigente, para monitoreo."""
+    return {
+        **_metricas.resumen(),
+        "clientes": len(_clientes),
+        "configuracion": {k: v for k, v in opciones_cliente().items() if k != "appname"},
+    }
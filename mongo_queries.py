@@ -1,6 +1,27 @@
 # mongo_queries.py
+# Todas las funciones reciben la colección como parámetro. Lo normal es pasar
+# el rollup (rollup_denuncias.coleccion_rollup), que tiene los mismos campos
+# que 'denuncias' pero ya pre-agregados, así que los pipelines no cambian.
+#
+# Si el cubo en memoria (tensor_denuncias.py) está disponible, las consultas
+# se resuelven con sumas sobre el arreglo y Mongo solo se usa como respaldo.
+from tensor_denuncias import tensor_vigente, sumar, agrupar
+from mongo_cache import agregar, leer_version_datos
+from departamentos_dim import vistas_departamentales
+
+_snapshot = {"llave": None, "valor": None}
+
+
+def _mayores(docs, n):
+    """Los n documentos con más total (como $sort + $limit)."""
+    return sorted(docs, key=lambda d: d["total"], reverse=True)[:n]
+
 
 def total_denuncias(col, anio=None, departamento=None, modalidad=None):
+    t = tensor_vigente(col)
+    if t is not None:
+        return sumar(t, anios=anio or None, departamentos=departamento or None, modalidades=modalidad or None)
+
     filtros = {}
     if anio:
         filtros["ANIO"] = anio
@@ -14,11 +35,16 @@ def total_denuncias(col, anio=None, departamento=None, modalidad=None):
         {"$group": {"_id": None, "total": {"$sum": "$cantidad"}}}
     ]
 
-    res = list(col.aggregate(pipeline))
+    res = agregar(col, pipeline)
     return res[0]["total"] if res else 0
 
 
 def modalidad_mas_frecuente(col, anio=None, departamento=None):
+    t = tensor_vigente(col)
+    if t is not None:
+        top = _mayores(agrupar(t, "modalidad", anios=anio or None, departamentos=departamento or None), 1)
+        return (top[0]["_id"], top[0]["total"]) if top else (None, 0)
+
     filtros = {}
     if anio:
         filtros["ANIO"] = anio
@@ -32,13 +58,17 @@ def modalidad_mas_frecuente(col, anio=None, departamento=None):
         {"$limit": 1}
     ]
 
-    res = list(col.aggregate(pipeline))
+    res = agregar(col, pipeline)
     if res:
         return res[0]["_id"], res[0]["total"]
     return None, 0
 
 
 def top_modalidades(col, anio=None, departamento=None, n=5):
+    t = tensor_vigente(col)
+    if t is not None:
+        return _mayores(agrupar(t, "modalidad", anios=anio or None, departamentos=departamento or None), n)
+
     filtros = {}
     if anio:
         filtros["ANIO"] = anio
@@ -52,10 +82,14 @@ def top_modalidades(col, anio=None, departamento=None, n=5):
         {"$limit": n}
     ]
 
-    return list(col.aggregate(pipeline))
+    return agregar(col, pipeline)
 
 
 def ranking_departamentos(col, anio=None, modalidad=None, n=10):
+    t = tensor_vigente(col)
+    if t is not None:
+        return _mayores(agrupar(t, "departamento", anios=anio or None, modalidades=modalidad or None), n)
+
     filtros = {}
     if anio:
         filtros["ANIO"] = anio
@@ -69,10 +103,14 @@ def ranking_departamentos(col, anio=None, modalidad=None, n=10):
         {"$limit": n}
     ]
 
-    return list(col.aggregate(pipeline))
+    return agregar(col, pipeline)
 
 
 def tendencia_modalidad(col, departamento, modalidad):
+    t = tensor_vigente(col)
+    if t is not None:
+        return agrupar(t, "anio", departamentos=departamento, modalidades=modalidad)
+
     pipeline = [
         {"$match": {
             "DPTO_HECHO_NEW": departamento,
@@ -81,10 +119,15 @@ def tendencia_modalidad(col, departamento, modalidad):
         {"$group": {"_id": "$ANIO", "total": {"$sum": "$cantidad"}}},
         {"$sort": {"_id": 1}}
     ]
-    return list(col.aggregate(pipeline))
+    return agregar(col, pipeline)
 
 
 def comparar_dos_anios(col, departamento, modalidad, anio1, anio2):
+    t = tensor_vigente(col)
+    if t is not None:
+        return (sumar(t, anios=anio1, departamentos=departamento, modalidades=modalidad),
+                sumar(t, anios=anio2, departamentos=departamento, modalidades=modalidad))
+
     pipeline = [
         {"$match": {
             "DPTO_HECHO_NEW": departamento,
@@ -94,5 +137,155 @@ def comparar_dos_anios(col, departamento, modalidad, anio1, anio2):
         {"$group": {"_id": "$ANIO", "total": {"$sum": "$cantidad"}}}
     ]
 
-    res = {r["_id"]: r["total"] for r in col.aggregate(pipeline)}
+    res = {r["_id"]: r["total"] for r in agregar(col, pipeline)}
     return res.get(anio1, 0), res.get(anio2, 0)
+
+
+# ==========================================
+# VARIANTES POR LOTE
+# ==========================================
+# Reciben una lista de tuplas de filtros y devuelven un dict {tupla: resultado}
+# con las mismas respuestas que la función individual. Sobre Mongo se resuelven
+# en un solo viaje: un $facet con una rama por tupla distinta, precedido de un
+# $match con el $or de todos los filtros para no recorrer filas que nadie pidió.
+
+def _filtros(anio=None, departamento=None, modalidad=None):
+    filtros = {}
+    if anio:
+        filtros["ANIO"] = anio
+    if departamento:
+        filtros["DPTO_HECHO_NEW"] = departamento
+    if modalidad:
+        filtros["P_MODALIDADES"] = modalidad
+    return filtros
+
+
+def _facet_lote(col, filtros_por_consulta, etapas):
+    """Ejecuta 'etapas' para cada filtro en una sola agregación. Devuelve {consulta: docs}."""
+    consultas = list(filtros_por_consulta)
+    if not consultas:
+        return {}
+
+    filtros = [filtros_por_consulta[c] for c in consultas]
+    pipeline = []
+    if all(filtros):
+        pipeline.append({"$match": {"$or": filtros}})
+    pipeline.append({"$facet": {f"q{i}": [{"$match": f}] + etapas for i, f in enumerate(filtros)}})
+
+    res = agregar(col, pipeline, allowDiskUse=True)
+    facetas = res[0] if res else {}
+    return {c: facetas.get(f"q{i}", []) for i, c in enumerate(consultas)}
+
+
+def totales_lote(col, consultas):
+    """consultas: [(anio, departamento, modalidad), ...] -> {tupla: total}"""
+    consultas = list(dict.fromkeys(tuple(c) for c in consultas))
+    t = tensor_vigente(col)
+    if t is not None:
+        return {(a, d, m): sumar(t, anios=a or None, departamentos=d or None, modalidades=m or None)
+                for a, d, m in consultas}
+
+    res = _facet_lote(col, {c: _filtros(*c) for c in consultas},
+                      [{"$group": {"_id": None, "total": {"$sum": "$cantidad"}}}])
+    return {c: docs[0]["total"] if docs else 0 for c, docs in res.items()}
+
+
+def top_modalidades_lote(col, consultas, n=5):
+    """consultas: [(anio, departamento), ...] -> {tupla: [{"_id": modalidad, "total"}]}"""
+    consultas = list(dict.fromkeys(tuple(c) for c in consultas))
+    t = tensor_vigente(col)
+    if t is not None:
+        return {(a, d): _mayores(agrupar(t, "modalidad", anios=a or None, departamentos=d or None), n)
+                for a, d in consultas}
+
+    return _facet_lote(col, {(a, d): _filtros(a, d) for a, d in consultas}, [
+        {"$group": {"_id": "$P_MODALIDADES", "total": {"$sum": "$cantidad"}}},
+        {"$sort": {"total": -1}},
+        {"$limit": n}
+    ])
+
+
+def modalidad_mas_frecuente_lote(col, consultas):
+    """consultas: [(anio, departamento), ...] -> {tupla: (modalidad, total)}"""
+    return {c: (docs[0]["_id"], docs[0]["total"]) if docs else (None, 0)
+            for c, docs in top_modalidades_lote(col, consultas, n=1).items()}
+
+
+def ranking_departamentos_lote(col, consultas, n=10):
+    """consultas: [(anio, modalidad), ...] -> {tupla: [{"_id": departamento, "total"}]}"""
+    consultas = list(dict.fromkeys(tuple(c) for c in consultas))
+    t = tensor_vigente(col)
+    if t is not None:
+        return {(a, m): _mayores(agrupar(t, "departamento", anios=a or None, modalidades=m or None), n)
+                for a, m in consultas}
+
+    return _facet_lote(col, {(a, m): _filtros(a, modalidad=m) for a, m in consultas}, [
+        {"$group": {"_id": "$DPTO_HECHO_NEW", "total": {"$sum": "$cantidad"}}},
+        {"$sort": {"total": -1}},
+        {"$limit": n}
+    ])
+
+
+def tendencia_modalidad_lote(col, consultas):
+    """consultas: [(departamento, modalidad), ...] -> {tupla: [{"_id": anio, "total"}]}"""
+    consultas = list(dict.fromkeys(tuple(c) for c in consultas))
+    t = tensor_vigente(col)
+    if t is not None:
+        return {(d, m): agrupar(t, "anio", departamentos=d, modalidades=m) for d, m in consultas}
+
+    return _facet_lote(col, {(d, m): {"DPTO_HECHO_NEW": d, "P_MODALIDADES": m} for d, m in consultas}, [
+        {"$group": {"_id": "$ANIO", "total": {"$sum": "$cantidad"}}},
+        {"$sort": {"_id": 1}}
+    ])
+
+
+# Un solo pipeline con todas las vistas del dashboard (resumen anual,
+# modalidades, trimestres y departamentos) en lugar de un escaneo por ruta.
+PIPELINE_DASHBOARD = [
+    {"$facet": {
+        "por_anio": [
+            {"$group": {"_id": "$ANIO", "total": {"$sum": "$cantidad"}}},
+            {"$sort": {"_id": 1}}
+        ],
+        "por_modalidad": [
+            {"$group": {"_id": "$P_MODALIDADES", "total": {"$sum": "$cantidad"}}},
+            {"$sort": {"total": -1}}
+        ],
+        "por_trimestre": [
+            {"$group": {"_id": "$anio_trimestre", "total": {"$sum": "$cantidad"}}},
+            {"$sort": {"_id": 1}}
+        ],
+        "por_departamento": [
+            {"$group": {"_id": "$DPTO_HECHO_NEW", "total": {"$sum": "$cantidad"}}},
+            {"$sort": {"total": 1}}
+        ]
+    }}
+]
+
+
+def snapshot_dashboard(col):
+    """
+    Foto del dashboard: una sola pasada $facet sobre la colección (el rollup),
+    más las vistas departamentales unidas con la dimensión. Se recalcula solo
+    cuando cambia la versión de datos.
+    """
+    llave = (col.full_name, leer_version_datos(col.database))
+    if _snapshot["llave"] == llave:
+        return _snapshot["valor"]
+
+    res = agregar(col, PIPELINE_DASHBOARD, allowDiskUse=True)
+    facetas = res[0] if res else {}
+    valor = {
+        "por_anio": facetas.get("por_anio", []),
+        "por_modalidad": facetas.get("por_modalidad", []),
+        "por_trimestre": facetas.get("por_trimestre", []),
+        "por_departamento": facetas.get("por_departamento", []),
+    }
+    valor["departamentos"] = vistas_departamentales(valor["por_departamento"])
+    _snapshot.update(llave=llave, valor=valor)
+    return valor
+
+
+def vistas_departamentos(col):
+    """Ranking, mapa, regiones y per cápita (ver departamentos_dim.vistas_departamentales)."""
+    return snapshot_dashboard(col)["departamentos"]
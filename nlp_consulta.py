@@ -1,13 +1,9 @@
 # nlp_consulta.py
 import re
 
-DEPARTAMENTOS = [
-    "AMAZONAS","ANCASH","APURIMAC","AREQUIPA","AYACUCHO","CAJAMARCA","CUSCO",
-    "HUANCAVELICA","HUANUCO","ICA","JUNIN","LA LIBERTAD","LAMBAYEQUE",
-    "LIMA METROPOLITANA","LORETO","MADRE DE DIOS","MOQUEGUA","PASCO","PIURA",
-    "PROV. CONST. DEL CALLAO","PUNO","REGION LIMA","SAN MARTIN","TACNA",
-    "TUMBES","UCAYALI"
-]
+from departamentos_dim import CODIGOS
+
+DEPARTAMENTOS = sorted(CODIGOS)
 
 def extraer_anio(texto):
     match = re.search(r"(2018|2019|2020|2021|2022|2023|2024|2025|2026)", texto)
@@ -0,0 +1,100 @@
+# normalizacion.py
+# Campos canónicos que el ETL escribe en cada denuncia, para que los reportes
+# filtren por igualdad sobre campos indexados en lugar de usar $regex:
+#
+#   MOD_FAMILIA  -> familia de la modalidad ("EXTORSION", "HOMICIDIO", ...)
+#   DPTO_CODIGO  -> nombre canónico del departamento (ver departamentos_dim.py)
+#   DPTO_GRUPO   -> agrupación usada en el chat/reportes ("LIMA" = Lima Metropolitana + Región Lima)
+#   MACRO_REGION -> "COSTA", "SIERRA" o "SELVA"
+import pandas as pd
+
+from departamentos_dim import normalizar_texto, buscar_departamento
+
+CAMPOS_NORMALIZADOS = ["MOD_FAMILIA", "DPTO_CODIGO", "DPTO_GRUPO", "MACRO_REGION"]
+
+# (texto a buscar en la modalidad normalizada, código de familia), en orden de prioridad
+FAMILIAS_MODALIDAD = [
+    ("EXTORSI", "EXTORSION"),
+    ("HOMICIDI", "HOMICIDIO"),
+    ("FEMINICIDI", "FEMINICIDIO"),
+    ("SICARIATO", "SICARIATO"),
+    ("SECUESTRO", "SECUESTRO"),
+    ("VIOLACION", "VIOLACION_SEXUAL"),
+    ("VIOLENCIA", "VIOLENCIA"),
+    ("ROBO", "ROBO"),
+    ("HURTO", "HURTO"),
+    ("ESTAFA", "ESTAFA"),
+    ("LESION", "LESIONES"),
+]
+FAMILIA_OTROS = "OTROS"
+
+SIN_DATO = "DESCONOCIDO"
+
+
+def familia_modalidad(modalidad):
+    texto = normalizar_texto(modalidad)
+    for patron, familia in FAMILIAS_MODALIDAD:
+        if patron in texto:
+            return familia
+    return FAMILIA_OTROS
+
+
+def codigo_departamento(nombre):
+    fila = buscar_departamento(nombre)
+    return fila["codigo"] if fila else (normalizar_texto(nombre) or SIN_DATO)
+
+
+def grupo_departamento(nombre):
+    fila = buscar_departamento(nombre)
+    return fila["grupo"] if fila else codigo_departamento(nombre)
+
+
+def macro_region(nombre):
+    fila = buscar_departamento(nombre)
+    return fila["region"].upper() if fila else SIN_DATO
+
+
+def _mapear(serie, funcion):
+    """Aplica 'funcion' una vez por valor distinto (hay pocos) y no por fila."""
+    valores = {v: funcion(v) for v in pd.unique(serie.astype(object))}
+    return serie.astype(object).map(valores)
+
+
+def agregar_campos_normalizados(df):
+    """Agrega los campos canónicos a un bloque del ETL."""
+    if "P_MODALIDADES" in df.columns:
+        df["MOD_FAMILIA"] = _mapear(df["P_MODALIDADES"], familia_modalidad).astype("category")
+    if "DPTO_HECHO_NEW" in df.columns:
+        dpto = df["DPTO_HECHO_NEW"]
+        df["DPTO_CODIGO"] = _mapear(dpto, codigo_departamento).astype("category")
+        df["DPTO_GRUPO"] = _mapear(dpto, grupo_departamento).astype("category")
+        df["MACRO_REGION"] = _mapear(dpto, macro_region).astype("category")
+    return df
+
+
+def normalizar_coleccion(col):
+    """
+    Rellena los campos canónicos en una colección ya cargada, con un
+    update_many por valor distinto (decenas/cientos, no millones).
+    """
+    for modalidad in col.distinct("P_MODALIDADES"):
+        col.update_many({"P_MODALIDADES": modalidad}, {"$set": {"MOD_FAMILIA": familia_modalidad(modalidad)}})
+
+    for dpto in col.distinct("DPTO_HECHO_NEW"):
+        col.update_many({"DPTO_HECHO_NEW": dpto}, {"$set": {
+            "DPTO_CODIGO": codigo_departamento(dpto),
+            "DPTO_GRUPO": grupo_departamento(dpto),
+            "MACRO_REGION": macro_region(dpto),
+        }})
+    print(f"✅ Campos normalizados actualizados en '{col.name}'.")
+
+
+if __name__ == "__main__":
+    # Migración de una colección existente: python normalizacion.py
+    from ml_utils import db
+    from rollup_denuncias import construir_rollup
+    from mongo_cache import incrementar_version_datos
+
+    normalizar_coleccion(db["denuncias"])
+    construir_rollup(db)
+    incrementar_version_datos(db)
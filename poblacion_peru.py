@@ -1,35 +1,7 @@
 # poblacion_peru.py
 # Población aproximada por departamento (INEI/proyecciones)
 # Importante: nombres en MAYÚSCULA para que coincidan con DPTO_HECHO_NEW
+# (derivado de la dimensión canónica en departamentos_dim.py)
+from departamentos_dim import DEPARTAMENTOS
 
-poblacion_departamentos = {
-    "AMAZONAS": 420000,
-    "ANCASH": 1190000,
-    "APURIMAC": 405000,
-    "AREQUIPA": 1380000,
-    "AYACUCHO": 670000,
-    "CAJAMARCA": 1480000,
-    "CUSCO": 1360000,
-    "HUANCAVELICA": 365000,
-    "HUANUCO": 730000,
-    "ICA": 980000,
-    "JUNIN": 1380000,
-    "LA LIBERTAD": 2080000,
-    "LAMBAYEQUE": 1380000,
-
-    # 🔵 Tus valores del dataset
-    "LIMA METROPOLITANA": 10600000,   # Provincia de Lima
-    "REGION LIMA": 1040000,           # Lima provincias (Huacho)
-
-    "LORETO": 1030000,
-    "MADRE DE DIOS": 140000,
-    "MOQUEGUA": 190000,
-    "PASCO": 270000,
-    "PIURA": 2050000,
-    "PROV. CONST. DEL CALLAO": 1030000,  # Callao
-    "PUNO": 1240000,
-    "SAN MARTIN": 900000,
-    "TACNA": 370000,
-    "TUMBES": 270000,
-    "UCAYALI": 590000,
-}
+poblacion_departamentos = {d["codigo"]: d["poblacion"] for d in DEPARTAMENTOS}
@@ -0,0 +1,67 @@
+# presencia.py
+# Radar de usuarios online sin escribir en Mongo en cada petición.
+#
+# Cada petición solo anota la hora en memoria (con un intervalo mínimo por
+# usuario); un hilo vuelca los pendientes a 'usuarios.last_seen' con un único
+# bulk_write cada INTERVALO_VOLCADO segundos.
+import os
+import time
+import atexit
+import threading
+from datetime import datetime
+from pymongo import UpdateOne
+
+INTERVALO_VOLCADO = int(os.getenv("PRESENCIA_VOLCADO_SEGUNDOS", 30))
+# Un mismo usuario se registra como máximo una vez por este intervalo
+INTERVALO_MINIMO_USUARIO = int(os.getenv("PRESENCIA_DEBOUNCE_SEGUNDOS", 60))
+
+_pendientes = {}        # username -> datetime del último latido no volcado
+_ultimo_latido = {}     # username -> time.monotonic() del último latido aceptado
+_lock = threading.Lock()
+
+
+def registrar_actividad(username):
+    """Anota actividad del usuario en memoria (no toca la base de datos)."""
+    ahora = time.monotonic()
+    with _lock:
+        if ahora - _ultimo_latido.get(username, float("-inf")) < INTERVALO_MINIMO_USUARIO:
+            return
+        _ultimo_latido[username] = ahora
+        _pendientes[username] = datetime.now()
+
+
+def volcar_actividad(db):
+    """Escribe en bloque los latidos pendientes. Devuelve cuántos se volcaron."""
+    with _lock:
+        if not _pendientes:
+            return 0
+        lote = dict(_pendientes)
+        _pendientes.clear()
+
+    operaciones = [
+        UpdateOne({"username": username}, {"$max": {"last_seen": fecha}})
+        for username, fecha in lote.items()
+    ]
+    try:
+        db['usuarios'].bulk_write(operaciones, ordered=False)
+    except Exception as e:
+        print(f"Error volcando last_seen: {e}")
+        # Reencolamos lo que no se pudo escribir (sin pisar latidos más nuevos)
+        with _lock:
+            for username, fecha in lote.items():
+                _pendientes.setdefault(username, fecha)
+        return 0
+    return len(operaciones)
+
+
+def iniciar_volcado_periodico(db, intervalo=INTERVALO_VOLCADO):
+    def _bucle():
+        while True:
+            time.sleep(intervalo)
+            volcar_actividad(db)
+
+    hilo = threading.Thread(target=_bucle, name="volcado-presencia", daemon=True)
+    hilo.start()
+    # Último volcado al apagar el proceso
+    atexit.register(volcar_actividad, db)
+    return hilo
@@ -0,0 +1,135 @@
+# pronostico_2026.py
+# Proyección 2026 precalculada.
+#
+# La regresión se calcula una sola vez por versión de datos (en segundo plano)
+# y se guarda en la colección 'pronosticos' junto con la serie mensual usada
+# como entrada. '/prediccion-2026' y '/agente-estrategico' solo leen el
+# resultado guardado.
+import os
+import threading
+import time
+from datetime import datetime
+
+from pymongo import ReadPreference
+
+from mongo_cache import leer_version_datos
+from ml_utils import preparar_mensual, predecir_total_2026, formatear_contexto_historico
+
+COLECCION_PRONOSTICOS = "pronosticos"
+ID_PRONOSTICO = "total_2026"
+# Cada cuántos segundos el job revisa si hay una nueva versión de datos
+INTERVALO_REVISION = int(os.getenv("PRONOSTICO_INTERVALO_SEGUNDOS", 300))
+
+_actual = {"doc": None}
+_lock_calculo = threading.Lock()
+
+
+def _leer_guardado(col):
+    # Del primario: un secundario atrasado haría recalcular lo que ya está guardado
+    pronosticos = col.database.get_collection(COLECCION_PRONOSTICOS, read_preference=ReadPreference.PRIMARY)
+    return pronosticos.find_one({"_id": ID_PRONOSTICO})
+
+
+def calcular_pronostico(col, forzar=False):
+    """
+    Ejecuta la regresión y guarda el resultado con sus entradas. Si ya hay
+    uno guardado para la versión vigente (p. ej. lo calculó otro worker de
+    gunicorn) se usa ese, salvo con forzar=True.
+    """
+    with _lock_calculo:
+        version = leer_version_datos(col.database, forzar=True)
+        if not forzar:
+            guardado = _leer_guardado(col)
+            if guardado is not None and guardado.get("version") == version:
+                _actual["doc"] = guardado
+                return guardado
+        df = preparar_mensual(col)
+        total, etiquetas, valores, hist_val, hist_anio = predecir_total_2026(col, df=df)
+
+        doc = {
+            "_id": ID_PRONOSTICO,
+            "version": version,
+            "calculado": datetime.now(),
+            "total": total,
+            "etiquetas": etiquetas,
+            "valores": [float(v) for v in valores],
+            "historico_valores": [float(v) for v in hist_val],
+            "historico_anios": [int(a) for a in hist_anio],
+            "texto_contexto": formatear_contexto_historico(hist_val, hist_anio) if total else "Datos insuficientes",
+            # Entradas del modelo, para poder auditar el cálculo
+            "serie_mensual": df.to_dict(orient="records") if not df.empty else []
+        }
+
+        try:
+            col.database[COLECCION_PRONOSTICOS].replace_one({"_id": ID_PRONOSTICO}, doc, upsert=True)
+        except Exception as e:
+            print(f"⚠️ No se pudo guardar el pronóstico: {e}")
+
+        _actual["doc"] = doc
+        print(f"📈 Pronóstico 2026 recalculado (versión {version}): {total:,} casos.")
+        return doc
+
+
+def version_pronostico():
+    """Versión de datos del pronóstico en memoria (None si aún no se leyó)."""
+    doc = _actual["doc"]
+    return doc.get("version") if doc else None
+
+
+def refrescar_en_segundo_plano(col):
+    """Lanza el recálculo en un hilo, salvo que ya haya uno en curso."""
+    if _lock_calculo.locked():
+        return None
+    hilo = threading.Thread(target=calcular_pronostico, args=(col,), name="pronostico-2026", daemon=True)
+    hilo.start()
+    return hilo
+
+
+def obtener_pronostico(col):
+    """
+    Devuelve el pronóstico vigente sin recalcular en la petición.
+    Si está desactualizado se sirve el anterior y se refresca en segundo plano;
+    solo la primera vez (sin nada guardado) se calcula en línea.
+    """
+    version = leer_version_datos(col.database)
+    doc = _actual["doc"]
+
+    if doc is None:
+        try:
+            doc = col.database[COLECCION_PRONOSTICOS].find_one({"_id": ID_PRONOSTICO})
+        except Exception as e:
+            print(f"⚠️ No se pudo leer el pronóstico guardado: {e}")
+            doc = None
+        _actual["doc"] = doc
+
+    if doc is None:
+        return calcular_pronostico(col)
+
+    if doc.get("version") != version:
+        refrescar_en_segundo_plano(col)
+    return doc
+
+
+def iniciar_job_pronostico(obtener_col, intervalo=INTERVALO_REVISION):
+    """
+    Job en segundo plano: recalcula cuando el ETL publica una nueva versión.
+    'obtener_col' devuelve la colección a usar en cada vuelta (puede pasar
+    de 'denuncias' al rollup cuando el ETL lo construye).
+    """
+    def _bucle():
+        while True:
+            try:
+                col = obtener_col()
+                version = leer_version_datos(col.database)
+                doc = _actual["doc"]
+                if doc is None or doc.get("version") != version:
+                    # Relee lo guardado antes de recalcular: con varios workers
+                    # solo el primero que ve la versión nueva la calcula
+                    calcular_pronostico(col)
+            except Exception as e:
+                print(f"⚠️ Error en job de pronóstico: {e}")
+            time.sleep(intervalo)
+
+    hilo = threading.Thread(target=_bucle, name="job-pronostico", daemon=True)
+    hilo.start()
+    return hilo
@@ -0,0 +1,159 @@
+# reportes.py
+# Motor de reportes parametrizados sobre el rollup.
+#
+# Un reporte se describe con filtros (departamentos, modalidades, rango de
+# años), una granularidad de tiempo (anio / trimestre / mes) y la dimensión
+# que separa las series (modalidad, departamento o un solo total). Se compila
+# a un único pipeline $match + $group + $sort; los filtros se escriben en
+# forma canónica (listas ordenadas y sin repetidos) para que dos peticiones
+# equivalentes compartan la misma entrada de la caché de agregar().
+# Si el cubo en memoria (tensor_denuncias.py) está disponible, el reporte se
+# resuelve sobre él y el pipeline solo se usa como respaldo.
+from mongo_cache import agregar
+from tensor_denuncias import tensor_vigente, series_tiempo
+
+# Nivel de filtro -> campo del rollup
+NIVELES_DEPARTAMENTO = {
+    "departamento": "DPTO_HECHO_NEW",
+    "codigo": "DPTO_CODIGO",
+    "grupo": "DPTO_GRUPO",
+    "region": "MACRO_REGION",
+}
+NIVELES_MODALIDAD = {
+    "modalidad": "P_MODALIDADES",
+    "familia": "MOD_FAMILIA",
+}
+
+# Granularidad -> campos del período (además del año)
+GRANULARIDADES = {
+    "anio": {},
+    # Sin trimestre se cuenta en T1, como hacían las rutas originales (no se descarta)
+    "trimestre": {"trimestre": {"$ifNull": ["$trimestre", "T1"]}},
+    "mes": {"mes": "$MES"},
+}
+SERIES = ["modalidad", "departamento", "total"]
+
+
+def _lista(valores):
+    """Lista canónica (ordenada, sin repetidos ni vacíos) o None."""
+    if not valores:
+        return None
+    if isinstance(valores, str):
+        valores = [valores]
+    limpios = sorted({str(v).strip() for v in valores if v is not None and str(v).strip()})
+    return limpios or None
+
+
+def compilar_reporte(departamentos=None, modalidades=None, anio_desde=None, anio_hasta=None,
+                     granularidad="anio", serie="modalidad",
+                     nivel_departamento="departamento", nivel_modalidad="modalidad"):
+    """
+    Traduce los parámetros de un reporte a un pipeline sobre el rollup.
+    Lanza ValueError si algún parámetro no es válido.
+    """
+    if granularidad not in GRANULARIDADES:
+        raise ValueError(f"Granularidad inválida: {granularidad} (use {', '.join(GRANULARIDADES)}).")
+    if serie not in SERIES:
+        raise ValueError(f"Serie inválida: {serie} (use {', '.join(SERIES)}).")
+    if nivel_departamento not in NIVELES_DEPARTAMENTO:
+        raise ValueError(f"Nivel de departamento inválido: {nivel_departamento}.")
+    if nivel_modalidad not in NIVELES_MODALIDAD:
+        raise ValueError(f"Nivel de modalidad inválido: {nivel_modalidad}.")
+
+    campo_dpto = NIVELES_DEPARTAMENTO[nivel_departamento]
+    campo_mod = NIVELES_MODALIDAD[nivel_modalidad]
+
+    match = {}
+    departamentos = _lista(departamentos)
+    if departamentos:
+        match[campo_dpto] = {"$in": departamentos}
+    modalidades = _lista(modalidades)
+    if modalidades:
+        match[campo_mod] = {"$in": modalidades}
+
+    rango = {}
+    if anio_desde is not None:
+        rango["$gte"] = int(anio_desde)
+    if anio_hasta is not None:
+        rango["$lte"] = int(anio_hasta)
+    if rango.get("$gte") is not None and rango.get("$lte") is not None and rango["$gte"] > rango["$lte"]:
+        raise ValueError("El año inicial es mayor que el año final.")
+    if rango:
+        match["ANIO"] = rango
+
+    llave = {"anio": "$ANIO", **GRANULARIDADES[granularidad]}
+    if serie == "modalidad":
+        llave["serie"] = f"${campo_mod}"
+    elif serie == "departamento":
+        llave["serie"] = f"${campo_dpto}"
+
+    pipeline = [{"$match": match}] if match else []
+    pipeline += [
+        {"$group": {"_id": llave, "total": {"$sum": "$cantidad"}}},
+        {"$sort": {"_id": 1}}
+    ]
+    return pipeline
+
+
+def _etiqueta(periodo, granularidad):
+    anio = periodo[0]
+    if granularidad == "trimestre":
+        return f"{anio}-{periodo[1]}"
+    if granularidad == "mes":
+        return f"{anio}-{int(periodo[1]):02d}"
+    return str(anio)
+
+
+def ejecutar_reporte(col, departamentos=None, modalidades=None, anio_desde=None, anio_hasta=None,
+                     granularidad="anio", serie="modalidad",
+                     nivel_departamento="departamento", nivel_modalidad="modalidad"):
+    """
+    Ejecuta el reporte (cacheado por versión de datos) y lo devuelve listo
+    para graficar:
+      periodos -> etiquetas ordenadas ("2023", "2023-T1" o "2023-01")
+      series   -> {nombre: [total por período]} alineadas con 'periodos'
+      filas    -> [{"anio", "trimestre"/"mes", "serie", "total"}] sin pivotear
+    Si se filtró por modalidades (o departamentos) y la serie es esa misma
+    dimensión, cada valor pedido tiene su serie aunque no tenga datos.
+    """
+    pipeline = compilar_reporte(departamentos, modalidades, anio_desde, anio_hasta,
+                                granularidad, serie, nivel_departamento, nivel_modalidad)
+    campo_periodo = next(iter(GRANULARIDADES[granularidad]), None)
+
+    t = tensor_vigente(col)
+    if t is not None:
+        # Misma respuesta que el pipeline, sumando sobre el cubo en memoria
+        docs = series_tiempo(t, granularidad, serie if serie != "total" else None,
+                             anio_desde, anio_hasta, _lista(departamentos), _lista(modalidades),
+                             nivel_departamento, nivel_modalidad)
+    else:
+        docs = agregar(col, pipeline)
+
+    filas = []
+    acumulado = {}
+    for d in docs:
+        llave = d["_id"]
+        if llave.get("anio") is None or (campo_periodo and llave.get(campo_periodo) is None):
+            continue
+        periodo = (llave["anio"], llave[campo_periodo]) if campo_periodo else (llave["anio"],)
+        nombre = llave.get("serie", "Total") if serie != "total" else "Total"
+        acumulado[(periodo, nombre)] = acumulado.get((periodo, nombre), 0) + d["total"]
+        filas.append({**{k: v for k, v in llave.items() if k != "serie"}, "serie": nombre, "total": d["total"]})
+
+    periodos = sorted({p for p, _ in acumulado})
+    nombres = {n for _, n in acumulado}
+    if serie == "modalidad" and modalidades:
+        nombres |= set(_lista(modalidades))
+    elif serie == "departamento" and departamentos:
+        nombres |= set(_lista(departamentos))
+    elif serie == "total":
+        nombres.add("Total")
+
+    series = {n: [acumulado.get((p, n), 0) for p in periodos] for n in sorted(nombres, key=str)}
+    return {
+        "granularidad": granularidad,
+        "periodos": [_etiqueta(p, granularidad) for p in periodos],
+        "series": series,
+        "filas": filas,
+        "total": sum(acumulado.values()),
+    }
@@ -1,14 +1,19 @@
 import os
-from pymongo import MongoClient
+from mongo_cliente import obtener_cliente
 from dotenv import load_dotenv
 
 load_dotenv()
 uri_nube = os.getenv('MONGO_URI_ATLAS')
 
+# Sin esto, obtener_cliente(None) usaría MONGO_URI (la base de la app)
+if not uri_nube:
+    print("❌ ERROR: No tienes MONGO_URI_ATLAS en tu .env")
+    exit()
+
 print("🚑 INICIANDO ROLLBACK (Revertir cambios)...")
 
 try:
-    client = MongoClient(uri_nube)
+    client = obtener_cliente(uri_nube)
     db = client['denuncias_db']
     col = db['denuncias']
 
@@ -0,0 +1,150 @@
+# rollup_denuncias.py
+# Cubo pre-agregado de la colección 'denuncias':
+#   ANIO × MES × DPTO_HECHO_NEW × P_MODALIDADES -> suma de 'cantidad'
+#
+# Los documentos del rollup conservan los MISMOS nombres de campo que la
+# colección original (ANIO, MES, DPTO_HECHO_NEW, P_MODALIDADES, trimestre,
+# anio_trimestre, cantidad), así que cualquier pipeline que agrupe y sume
+# "$cantidad" funciona igual sobre el rollup, pero recorriendo unos pocos
+# miles de filas en lugar de la tabla completa.
+
+from datetime import datetime
+from mongo_cache import leer_version_datos
+from normalizacion import CAMPOS_NORMALIZADOS
+
+COLECCION_ORIGEN = "denuncias"
+COLECCION_ROLLUP = "denuncias_rollup"
+
+# Totales globales de la última carga (los muestra el dashboard)
+COLECCION_ESTADISTICAS = "estadisticas"
+ID_TOTALES = "totales_carga"
+_totales = {"version": None, "doc": None}
+# Colección resuelta por coleccion_rollup() para la versión de datos vigente
+_rollup = {"llave": None, "col": None}
+
+# Dimensiones del cubo. 'trimestre' y 'anio_trimestre' dependen del mes, y
+# los campos normalizados (MOD_FAMILIA, DPTO_GRUPO, ...) del departamento o
+# la modalidad, así que incluirlos en la llave no genera filas adicionales.
+DIMENSIONES = ["ANIO", "MES", "DPTO_HECHO_NEW", "P_MODALIDADES", "trimestre", "anio_trimestre"] + CAMPOS_NORMALIZADOS
+
+
+def _pipeline_rollup(anios=None):
+    """Pipeline que agrupa la colección original en celdas del cubo."""
+    pipeline = []
+    if anios:
+        pipeline.append({"$match": {"ANIO": {"$in": list(anios)}}})
+
+    pipeline += [
+        {
+            "$group": {
+                "_id": {d: f"${d}" for d in DIMENSIONES},
+                "cantidad": {"$sum": "$cantidad"},
+                "registros": {"$sum": 1}
+            }
+        },
+        {
+            "$project": {
+                **{d: f"$_id.{d}" for d in DIMENSIONES},
+                "cantidad": 1,
+                "registros": 1
+            }
+        }
+    ]
+    return pipeline
+
+
+def construir_rollup(db, origen=COLECCION_ORIGEN, destino=COLECCION_ROLLUP):
+    """
+    Reconstruye el rollup completo. Usa $out, que reemplaza la colección
+    destino de forma atómica: los lectores nunca ven un rollup a medias.
+    """
+    pipeline = _pipeline_rollup() + [{"$out": destino}]
+    db[origen].aggregate(pipeline, allowDiskUse=True)
+    total = db[destino].estimated_document_count()
+    print(f"✅ Rollup '{destino}' reconstruido: {total} celdas.")
+    guardar_totales(db, destino)
+    return total
+
+
+def actualizar_rollup(db, anios=None, origen=COLECCION_ORIGEN, destino=COLECCION_ROLLUP):
+    """
+    Refresco incremental: recalcula solo las celdas de los años indicados.
+    Sin años, equivale a una reconstrucción completa.
+    """
+    if not anios:
+        return construir_rollup(db, origen, destino)
+
+    anios = sorted({int(a) for a in anios})
+    # Borramos primero las celdas de esos años para no dejar combinaciones
+    # que ya no existan en la colección original.
+    db[destino].delete_many({"ANIO": {"$in": anios}})
+
+    pipeline = _pipeline_rollup(anios) + [
+        {"$merge": {"into": destino, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ]
+    db[origen].aggregate(pipeline, allowDiskUse=True)
+    total = db[destino].count_documents({"ANIO": {"$in": anios}})
+    print(f"✅ Rollup '{destino}' actualizado para {anios}: {total} celdas.")
+    guardar_totales(db, destino)
+    return total
+
+
+def guardar_totales(db, destino=COLECCION_ROLLUP):
+    """
+    Calcula desde el rollup (pocas filas) los totales que muestra el
+    dashboard y los guarda en 'estadisticas', para que la portada no
+    tenga que escanear la colección.
+    """
+    por_anio = list(db[destino].aggregate([
+        {"$group": {"_id": "$ANIO", "cantidad": {"$sum": "$cantidad"}, "registros": {"$sum": "$registros"}}}
+    ]))
+    doc = {
+        "total_registros": sum(d.get("registros", 0) for d in por_anio),
+        "total_denuncias": sum(d.get("cantidad", 0) for d in por_anio),
+        "anios": sorted(d["_id"] for d in por_anio if d["_id"] is not None),
+        "actualizado": datetime.now()
+    }
+    db[COLECCION_ESTADISTICAS].replace_one({"_id": ID_TOTALES}, doc, upsert=True)
+    return doc
+
+
+def leer_totales(db):
+    """Totales de la última carga, cacheados en memoria por versión de datos."""
+    version = leer_version_datos(db)
+    if _totales["doc"] is not None and _totales["version"] == version:
+        return _totales["doc"]
+
+    doc = db[COLECCION_ESTADISTICAS].find_one({"_id": ID_TOTALES})
+    if doc:
+        _totales.update(version=version, doc=doc)
+    return doc
+
+
+def coleccion_rollup(db, origen=COLECCION_ORIGEN, destino=COLECCION_ROLLUP):
+    """
+    Devuelve la colección del rollup si ya fue construida por el ETL;
+    si no, devuelve la colección original para no dejar las rutas sin datos.
+    La verificación se repite cada vez que cambia la versión de datos, así
+    que si la app arrancó antes del primer ETL pasa al rollup sin reiniciar.
+    """
+    llave = (db.name, origen, destino, leer_version_datos(db))
+    if _rollup["llave"] == llave:
+        return _rollup["col"]
+
+    try:
+        if db[destino].find_one({}, {"_id": 1}) is not None:
+            _rollup.update(llave=llave, col=db[destino])
+            return db[destino]
+    except Exception as e:
+        print(f"⚠️ No se pudo verificar el rollup: {e}")
+        return db[origen]
+
+    print(f"⚠️ Rollup '{destino}' vacío: las consultas usarán '{origen}' directamente.")
+    _rollup.update(llave=llave, col=db[origen])
+    return db[origen]
+
+
+if __name__ == "__main__":
+    # Reconstrucción manual: python rollup_denuncias.py
+    from ml_utils import db
+    construir_rollup(db)
@@ -0,0 +1,128 @@
+# snapshot_parquet.py
+# Foto columnar (Parquet) del rollup para responder consultas en memoria.
+#
+# El ETL la escribe al final de cada carga, marcada con la versión de datos
+# que acaba de publicar. La app la abre al iniciar (memory_map) y, mientras
+# esa versión coincida con la vigente en Mongo, es la fuente del cubo en
+# memoria (tensor_denuncias.py) sin volver a leer el rollup.
+# Si la foto no existe, no hay pyarrow o quedó atrasada, se lee de Mongo.
+import os
+import threading
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional: sin él todo va a Mongo
+    pa = pq = None
+
+from mongo_cache import leer_version_datos, MAYORIA
+from rollup_denuncias import COLECCION_ORIGEN, COLECCION_ROLLUP, DIMENSIONES
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshot")
+ARCHIVO_SNAPSHOT = os.path.join(SNAPSHOT_DIR, "denuncias_rollup.parquet")
+META_VERSION = b"version_datos"
+
+# Columnas de texto con pocos valores distintos -> category
+COLUMNAS_CATEGORICAS = [d for d in DIMENSIONES if d not in ("ANIO", "MES")]
+
+# Colecciones cuyos datos representa la foto (el rollup suma lo mismo que el original)
+COLECCIONES_EQUIVALENTES = {COLECCION_ORIGEN, COLECCION_ROLLUP}
+
+_snap = {"df": None, "version": None, "intentada": None}
+_lock = threading.Lock()
+
+
+# ==========================================
+# ESCRITURA (ETL)
+# ==========================================
+
+def dataframe_rollup(db, coleccion=COLECCION_ROLLUP, sesion=None):
+    """
+    Lee el rollup (pocos miles de filas) como DataFrame con tipos compactos.
+    Con 'sesion' (mongo_cache.sesion_causal) la lectura es 'majority' dentro de ella.
+    """
+    col = db[coleccion] if sesion is None else db.get_collection(coleccion, read_concern=MAYORIA)
+    docs = list(col.find({}, {"_id": 0, **{d: 1 for d in DIMENSIONES}, "cantidad": 1}, session=sesion))
+    df = pd.DataFrame(docs, columns=DIMENSIONES + ["cantidad"])
+    for c in ("ANIO", "MES"):
+        df[c] = pd.to_numeric(df[c], errors="coerce").astype("Int16")
+    for c in COLUMNAS_CATEGORICAS:
+        df[c] = df[c].astype("category")
+    df["cantidad"] = pd.to_numeric(df["cantidad"], errors="coerce").fillna(0).astype("int64")
+    return df
+
+
+def escribir_snapshot(db, version, ruta=ARCHIVO_SNAPSHOT, coleccion=COLECCION_ROLLUP):
+    """
+    Escribe la foto del rollup con la versión de datos en los metadatos.
+    Se escribe a un temporal y se reemplaza el archivo de una vez, para que
+    la app nunca abra un Parquet a medias.
+    """
+    if pq is None:
+        print("⚠️ pyarrow no está instalado: no se escribe la foto Parquet.")
+        return None
+
+    df = dataframe_rollup(db, coleccion)
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    metadatos = dict(tabla.schema.metadata or {})
+    metadatos[META_VERSION] = str(version).encode()
+    tabla = tabla.replace_schema_metadata(metadatos)
+
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    temporal = ruta + ".tmp"
+    pq.write_table(tabla, temporal, compression="zstd")
+    os.replace(temporal, ruta)
+    print(f"✅ Foto Parquet '{ruta}' escrita: {len(df):,} filas (versión {version}).")
+    return ruta
+
+
+# ==========================================
+# LECTURA (APP)
+# ==========================================
+
+def cargar_snapshot(ruta=ARCHIVO_SNAPSHOT):
+    """Abre la foto (memory_map) y la deja en memoria. Devuelve su versión o None."""
+    if pq is None or not os.path.exists(ruta):
+        return None
+    try:
+        tabla = pq.read_table(ruta, memory_map=True)
+        version = int((tabla.schema.metadata or {}).get(META_VERSION, b"-1"))
+        df = tabla.to_pandas()
+    except Exception as e:
+        print(f"⚠️ No se pudo leer la foto Parquet: {e}")
+        return None
+
+    with _lock:
+        _snap.update(df=df, version=version)
+    print(f"📦 Foto Parquet cargada: {len(df):,} filas (versión {version}).")
+    return version
+
+
+def snapshot_vigente(col):
+    """
+    DataFrame de la foto si representa los datos de 'col' en su versión
+    vigente; si no, None (y el llamador consulta Mongo). Ante un cambio de
+    versión se intenta recargar el archivo una sola vez.
+    """
+    if pq is None or col.name not in COLECCIONES_EQUIVALENTES:
+        return None
+
+    version = leer_version_datos(col.database)
+    if _snap["version"] == version:
+        return _snap["df"]
+
+    with _lock:
+        if _snap["intentada"] == version:
+            return None
+        _snap["intentada"] = version
+    if cargar_snapshot() == version:
+        return _snap["df"]
+    return None
+
+
+if __name__ == "__main__":
+    # Regenerar la foto desde el rollup actual: python snapshot_parquet.py
+    from ml_utils import db
+    escribir_snapshot(db, leer_version_datos(db, forzar=True))
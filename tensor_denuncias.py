@@ -0,0 +1,246 @@
+# tensor_denuncias.py
+# Cubo denso en memoria: ANIO × MES × DPTO_HECHO_NEW × P_MODALIDADES -> cantidad.
+#
+# El espacio es chico (≈ 8 años × 13 meses × 27 departamentos × unos cientos
+# de modalidades, unos pocos MB en int64), así que cualquier combinación de
+# filtros se responde recortando el arreglo y sumando, sin ir a Mongo.
+#
+# Se arma desde la foto Parquet si está vigente o, si no, leyendo el rollup
+# (pocos miles de filas), y se reconstruye cuando cambia la versión de datos.
+#
+# Ejes y etiquetas:
+#   "anio"         -> años presentes (ordenados)
+#   "mes"          -> 1..12 y un último casillero para meses fuera de rango o nulos
+#   "departamento" -> valores de DPTO_HECHO_NEW (+ None para nulos)
+#   "modalidad"    -> valores de P_MODALIDADES (+ None para nulos)
+import threading
+
+import numpy as np
+import pandas as pd
+
+from mongo_cache import leer_version_datos, lee_de_secundario, sesion_causal
+from rollup_denuncias import COLECCION_ROLLUP
+from snapshot_parquet import COLECCIONES_EQUIVALENTES, snapshot_vigente, dataframe_rollup
+
+EJES = ["anio", "mes", "departamento", "modalidad"]
+MESES = list(range(1, 13)) + [None]
+TRIMESTRES = ["T1", "T2", "T3", "T4"]
+# Casillero de mes -> trimestre, con el criterio del ETL (agregar_trimestre):
+# todo mes fuera de 1-9 (incluido el casillero de "sin mes") cae en T4
+TRIMESTRE_DE_MES = np.array([0, 0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3, 3])
+
+# Niveles alternativos de cada eje (campos normalizados del rollup)
+NIVELES = {
+    "departamento": {"departamento": "DPTO_HECHO_NEW", "codigo": "DPTO_CODIGO",
+                     "grupo": "DPTO_GRUPO", "region": "MACRO_REGION"},
+    "modalidad": {"modalidad": "P_MODALIDADES", "familia": "MOD_FAMILIA"},
+}
+
+_tensor = {"version": None, "valor": None}
+_lock = threading.Lock()
+
+
+# ==========================================
+# CONSTRUCCIÓN
+# ==========================================
+
+def _codigos_categoria(serie):
+    """Códigos enteros y etiquetas de una columna; los nulos van al último casillero."""
+    cat = serie.astype("category")
+    etiquetas = [str(c) for c in cat.cat.categories] + [None]
+    codigos = cat.cat.codes.to_numpy().astype(np.int64)
+    codigos[codigos < 0] = len(etiquetas) - 1
+    return codigos, etiquetas
+
+
+def _niveles(df, campo_base, etiquetas, niveles):
+    """Para cada nivel (p. ej. 'grupo'), la etiqueta que le toca a cada casillero del eje."""
+    resultado = {}
+    for nivel, campo in niveles.items():
+        if campo == campo_base:
+            resultado[nivel] = np.array(etiquetas, dtype=object)
+        elif campo in df.columns:
+            mapa = df.groupby(df[campo_base].astype(object), observed=True)[campo].first().astype(object)
+            resultado[nivel] = np.array([mapa.get(e) for e in etiquetas], dtype=object)
+        else:
+            resultado[nivel] = np.array([None] * len(etiquetas), dtype=object)
+    return resultado
+
+
+def construir_tensor(df):
+    """Arma el cubo denso a partir de un DataFrame con las columnas del rollup."""
+    df = df[df["ANIO"].notna()]
+    anio = df["ANIO"].astype("int64").to_numpy()
+    anios = sorted(int(a) for a in np.unique(anio))
+
+    mes = pd.to_numeric(df["MES"], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    i_mes = np.where((mes >= 1) & (mes <= 12), np.nan_to_num(mes) - 1, 12).astype(np.int64)
+    i_anio = np.searchsorted(anios, anio)
+    i_dpto, departamentos = _codigos_categoria(df["DPTO_HECHO_NEW"])
+    i_mod, modalidades = _codigos_categoria(df["P_MODALIDADES"])
+
+    datos = np.zeros((len(anios), len(MESES), len(departamentos), len(modalidades)), dtype=np.int64)
+    np.add.at(datos, (i_anio, i_mes, i_dpto, i_mod), df["cantidad"].to_numpy(dtype=np.int64))
+
+    return {
+        "datos": datos,
+        "etiquetas": {"anio": anios, "mes": MESES, "departamento": departamentos, "modalidad": modalidades},
+        "niveles": {
+            "departamento": _niveles(df, "DPTO_HECHO_NEW", departamentos, NIVELES["departamento"]),
+            "modalidad": _niveles(df, "P_MODALIDADES", modalidades, NIVELES["modalidad"]),
+        },
+    }
+
+
+def tensor_vigente(col):
+    """
+    Cubo de la versión de datos vigente, o None si 'col' no es una colección
+    que el cubo represente (o no se pudo armar): el llamador usa Mongo.
+    """
+    if col.name not in COLECCIONES_EQUIVALENTES:
+        return None
+
+    version = leer_version_datos(col.database)
+    if _tensor["version"] == version:
+        return _tensor["valor"]
+
+    with _lock:
+        if _tensor["version"] == version:
+            return _tensor["valor"]
+        df = snapshot_vigente(col)
+        if df is None:
+            # Sin foto vigente: solo el rollup es lo bastante chico para leerlo entero
+            if col.name != COLECCION_ROLLUP:
+                return None
+            try:
+                if lee_de_secundario(col):
+                    # El cubo queda con la versión que el secundario ya refleja
+                    with sesion_causal(col.database) as (sesion, version):
+                        df = dataframe_rollup(col.database, col.name, sesion=sesion)
+                else:
+                    df = dataframe_rollup(col.database, col.name)
+            except Exception as e:
+                print(f"⚠️ No se pudo leer el rollup para el cubo: {e}")
+                return None
+        valor = construir_tensor(df)
+        _tensor.update(version=version, valor=valor)
+    print(f"🧊 Cubo en memoria armado: {valor['datos'].shape} (versión {version}).")
+    return valor
+
+
+# ==========================================
+# RECORTES Y SUMAS
+# ==========================================
+
+def _como_lista(valores):
+    if valores is None:
+        return None
+    if isinstance(valores, (list, tuple, set)):
+        return list(valores)
+    return [valores]
+
+
+def seleccion(t, eje, valores=None, nivel=None):
+    """
+    Máscara booleana sobre un eje. 'valores' es un valor o una lista (None =
+    todo el eje); 'nivel' permite filtrar por un campo normalizado, p. ej.
+    seleccion(t, "departamento", ["LIMA"], nivel="grupo").
+    """
+    valores = _como_lista(valores)
+    if nivel and eje in t["niveles"]:
+        etiquetas = t["niveles"][eje][nivel]
+    else:
+        etiquetas = np.array(t["etiquetas"][eje], dtype=object)
+    if valores is None:
+        return np.ones(len(etiquetas), dtype=bool)
+    # Etiquetas mezclan texto y None: comparación por conjunto, no np.isin (ordena)
+    buscados = set(valores)
+    return np.array([e in buscados for e in etiquetas], dtype=bool)
+
+
+def recortar(t, anios=None, meses=None, departamentos=None, modalidades=None,
+             nivel_departamento=None, nivel_modalidad=None):
+    """Sub-cubo con los filtros aplicados, más las máscaras usadas por eje."""
+    mascaras = {
+        "anio": seleccion(t, "anio", anios),
+        "mes": seleccion(t, "mes", meses),
+        "departamento": seleccion(t, "departamento", departamentos, nivel_departamento),
+        "modalidad": seleccion(t, "modalidad", modalidades, nivel_modalidad),
+    }
+    sub = t["datos"][np.ix_(*(np.flatnonzero(mascaras[e]) for e in EJES))]
+    return sub, mascaras
+
+
+def sumar(t, **filtros):
+    """Total para una combinación de filtros (ver recortar)."""
+    sub, _ = recortar(t, **filtros)
+    return int(sub.sum())
+
+
+def agrupar(t, eje, **filtros):
+    """
+    Totales por un eje con los filtros aplicados, en el formato de los
+    pipelines ([{"_id": etiqueta, "total": n}]); se omiten los ceros.
+    """
+    sub, mascaras = recortar(t, **filtros)
+    pos = EJES.index(eje)
+    totales = sub.sum(axis=tuple(i for i in range(len(EJES)) if i != pos))
+    etiquetas = np.array(t["etiquetas"][eje], dtype=object)[mascaras[eje]]
+    return [{"_id": e, "total": int(v)} for e, v in zip(etiquetas, totales) if v]
+
+
+def series_tiempo(t, granularidad="anio", serie=None, anio_desde=None, anio_hasta=None,
+                  departamentos=None, modalidades=None, nivel_departamento=None, nivel_modalidad=None):
+    """
+    Totales por período (anio / trimestre / mes) y, opcionalmente, por serie
+    ("modalidad" o "departamento", agrupando según su nivel). Devuelve los
+    mismos documentos que el pipeline de reportes.compilar_reporte:
+    [{"_id": {"anio", "trimestre"|"mes", "serie"}, "total"}].
+    """
+    anios = np.array(t["etiquetas"]["anio"], dtype=np.int64)
+    en_rango = np.ones(len(anios), dtype=bool)
+    if anio_desde is not None:
+        en_rango &= anios >= int(anio_desde)
+    if anio_hasta is not None:
+        en_rango &= anios <= int(anio_hasta)
+
+    sub, mascaras = recortar(t, anios=anios[en_rango].tolist(), departamentos=departamentos,
+                             modalidades=modalidades, nivel_departamento=nivel_departamento,
+                             nivel_modalidad=nivel_modalidad)
+
+    # Eje de tiempo -> (años, períodos)
+    if granularidad == "mes":
+        tiempo, campo, periodos = sub[:, :12], "mes", MESES[:12]
+    elif granularidad == "trimestre":
+        tiempo = np.stack([sub[:, TRIMESTRE_DE_MES == q].sum(axis=1) for q in range(4)], axis=1)
+        campo, periodos = "trimestre", TRIMESTRES
+    else:
+        tiempo, campo, periodos = sub.sum(axis=1, keepdims=True), None, [None]
+
+    # Eje de serie -> grupos de casilleros con la misma etiqueta
+    if serie in ("departamento", "modalidad"):
+        pos, nivel = (2, nivel_departamento) if serie == "departamento" else (3, nivel_modalidad)
+        otro = 3 if pos == 2 else 2
+        tiempo = tiempo.sum(axis=otro)
+        etiquetas = t["niveles"][serie][nivel or serie][mascaras[serie]]
+        grupos = {}
+        for i, e in enumerate(etiquetas):
+            grupos.setdefault(e, []).append(i)
+        por_serie = {e: tiempo[:, :, idx].sum(axis=2) for e, idx in grupos.items()}
+    else:
+        por_serie = {None: tiempo.sum(axis=(2, 3))}
+
+    docs = []
+    anios_sel = anios[en_rango]
+    for nombre, matriz in por_serie.items():
+        for i, anio in enumerate(anios_sel):
+            for j, p in enumerate(periodos):
+                if not matriz[i, j]:
+                    continue
+                llave = {"anio": int(anio)}
+                if campo:
+                    llave[campo] = p
+                if serie in ("departamento", "modalidad"):
+                    llave["serie"] = nombre
+                docs.append({"_id": llave, "total": int(matriz[i, j])})
+    return docs
@@ -1,5 +1,5 @@
 import os
-from pymongo import MongoClient
+from mongo_cliente import obtener_cliente
 from dotenv import load_dotenv
 
 # 1. Cargar configuración
@@ -12,7 +12,7 @@ if not uri_nube:
 
 print("🔌 Conectando a la Nube...")
 try:
-    client = MongoClient(uri_nube)
+    client = obtener_cliente(uri_nube)
     db = client['denuncias_db'] # <--- CONFIRMA SI TU BD SE LLAMA ASÍ
     col = db['denuncias']       # <--- CONFIRMA SI TU COLECCIÓN SE LLAMA ASÍ
 
@@ -1,8 +1,8 @@
 # ver_errores.py
-from pymongo import MongoClient
+from mongo_cliente import obtener_cliente
 
 # Conexión (Ajusta si tu URI es diferente)
-client = MongoClient("mongodb://localhost:27017/")
+client = obtener_cliente("mongodb://localhost:27017/")
 db = client["sidpol_db"] # OJO: Pon el nombre real de tu BD
 col = db["denuncias"]    # OJO: Pon el nombre real de tu colección
 
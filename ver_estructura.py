@@ -1,8 +1,8 @@
-from pymongo import MongoClient
+from mongo_cliente import obtener_cliente
 import pprint
 
 # Conexión
-client = MongoClient("mongodb://localhost:27017/")
+client = obtener_cliente("mongodb://localhost:27017/")
 db = client["sidpol_db"] 
 col = db["denuncias"]
 